@@ -1,21 +1,23 @@
-import os
+import logging
+import re
+import sys
 from pathlib import Path
 
-from dotenv import load_dotenv
-from langchain.chat_models import ChatOpenAI
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
 from langchain.prompts.chat import ChatPromptTemplate
 
-from files import scan_subfolders, read_contents
-from rag_test import read_all_file_contents
+from context_builder import retrieve_context
+from dep_graph import build_graph
+from indexing import open_vector_store, index_repository
+from journal import RunJournal, atomic_write
+from llm_cache import enable_llm_cache
+from metrics import configure_logging, metrics
+from models import get_embeddings, get_model
+import streaming
+from tokens import count_tokens, model_name_of
 from const import paths
 
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-
-model = ChatOpenAI(openai_api_key=api_key)
+logger = logging.getLogger(__name__)
 
 def clean_mermaid_output(output: str) -> str:
     """
@@ -30,90 +32,90 @@ def clean_mermaid_output(output: str) -> str:
         output = output[:-3].strip()
     return output
 
-def generate_diagram_with_rag(vector_store, model,index):
-    print("[📚] Retrieving all content from vector DB for summarization...")
 
-    results = vector_store.similarity_search(
-        query="What are the main components and their relationships in the codebase?",
-        k=50
-    )
-    key_extensions = {
-        ".py",
-        ".js",
-        ".ts",
-        ".java",
-        ".cs",
-        ".cpp",
-        ".c",
-        ".go",
-        ".rb",
-        ".php",
-        ".rs",
-        ".kt",
-        ".swift",
-        ".scala",
-        ".sh",
-        ".pl",
-        ".dart",
-        ".html",
-        ".css",
-        ".json",
-        ".xml",
-        ".yml",
-        ".yaml",
-        ".sql",
-        ".jsx",
-        ".tsx",
-    }
-    
-    filtered_docs = []
-    for doc in results:
-        metadata = doc.metadata
-        ext = metadata.get("extension", "").lower()
-        if ext and (ext.startswith(".") and ext in key_extensions) or (f".{ext}" in key_extensions):
-            filtered_docs.append(doc.page_content)
-
-    full_context = "\n".join(filtered_docs)
+class MermaidFenceFilter(streaming.StripFilter):
+    """
+    `clean_mermaid_output` applied to a stream: the opening fence is stripped
+    once enough of the response has arrived to recognize it, and a trailing
+    run of whitespace and backticks is held back until the stream ends.
+    """
+
+    _tail_pattern = re.compile(r"[\s`]*$")
+
+    def _strip_head(self, text):
+        text = text.lstrip()
+        if "```mermaid".startswith(text):
+            return None
+        head = text
+        if head.startswith("```mermaid"):
+            head = head[len("```mermaid"):].lstrip()
+        if head.startswith("```"):
+            head = head[len("```"):].lstrip()
+        if not head or "```".startswith(head):
+            return None
+        return head
+
+    def _strip_tail(self, tail):
+        tail = tail.rstrip()
+        if tail.endswith("```"):
+            tail = tail[:-3].rstrip()
+        return tail
+
+    def clean(self, text):
+        return clean_mermaid_output(text)
+
+architecture_system_prompt = (
+    "You are a senior software architect. Your job is to analyze codebases and generate accurate, high-level architecture diagrams using Mermaid."
+
+    "Analyze the structure and purpose of the following. Determine its architectural style or design pattern if applicable (e.g., monolithic, client-server, layered, microservices, modular, or single-purpose).\n\n"
+    "Then, generate a **high-level architecture diagram** that shows the main components and how they interact or relate to each other.\n\n"
+    "Abstract the system into logical components such as:\n"
+    "- Frontend or UI layer (if any)\n"
+    "- Backend or API services\n"
+    "- Databases or storage\n"
+    "- Background jobs, workers, or schedulers\n"
+    "- Third-party integrations or cloud services\n"
+    "- Configuration or environment dependencies\n"
+    "- Core modules or internal layers (e.g., `Compiler`, `CLI`, `SDK`, etc.)\n\n"
+    "Use **Mermaid syntax** in `graph TD` layout:\n"
+    "- Group related parts into `subgraph` blocks (e.g., `Frontend`, `Backend`, `Database`, `External Services`, `Core Modules`).\n"
+    "- Show **connections both within subgraphs and between subgraphs**, if components interact.\n"
+    "- Use directional arrows to show communication flow, data flow, or dependency relationships.\n"
+    "- Label each node with concise, meaningful names (e.g., `React Frontend`, `Node.js API`, `Redis Cache`, `GitHub API`, `.env Config`, `Parser Module`, `CLI Entry Point`).\n\n"
+    "✅ Only output a valid Mermaid diagram inside a code block.\n"
+    "🚫 Do not include file paths, filenames, explanations, or extra markdown.\n\n"
+    "Example:\n\n"
+    "graph TD\n"
+    "  subgraph Frontend\n"
+    "    A[Next.js App]\n"
+    "  end\n"
+    "  subgraph Backend\n"
+    "    B[Express.js Server]\n"
+    "    B --> C[(PostgreSQL)]\n"
+    "    B --> D[Stripe API]\n"
+    "    B --> E[.env Configuration]\n"
+    "  end\n"
+    "  A --> B\n\n"
+    "Additional guidelines:\n"
+    "- If the context includes too much information, focus on the components most essential to the system’s functionality and architecture.\n"
+    "- %% Only include high-level logical components, not file names."
+)
+
+def generate_diagram_with_rag(vector_store, model,index, max_tokens=8000, use_mmr=False, output_path=None):
+    logger.info("[📚] Retrieving all content from vector DB for summarization...")
+
+    with metrics.span("retrieve"):
+        full_context = retrieve_context(
+            vector_store,
+            query="What are the main components and their relationships in the codebase?",
+            model=model,
+            k=50,
+            max_tokens=max_tokens,
+            use_mmr=use_mmr,
+        )
 
     architecture_prompt = ChatPromptTemplate.from_messages([
-        (
-            "system",
-            "You are a senior software architect. Your job is to analyze codebases and generate accurate, high-level architecture diagrams using Mermaid."
-            
-            "Analyze the structure and purpose of the following. Determine its architectural style or design pattern if applicable (e.g., monolithic, client-server, layered, microservices, modular, or single-purpose).\n\n"
-            "Then, generate a **high-level architecture diagram** that shows the main components and how they interact or relate to each other.\n\n"
-            "Abstract the system into logical components such as:\n"
-            "- Frontend or UI layer (if any)\n"
-            "- Backend or API services\n"
-            "- Databases or storage\n"
-            "- Background jobs, workers, or schedulers\n"
-            "- Third-party integrations or cloud services\n"
-            "- Configuration or environment dependencies\n"
-            "- Core modules or internal layers (e.g., `Compiler`, `CLI`, `SDK`, etc.)\n\n"
-            "Use **Mermaid syntax** in `graph TD` layout:\n"
-            "- Group related parts into `subgraph` blocks (e.g., `Frontend`, `Backend`, `Database`, `External Services`, `Core Modules`).\n"
-            "- Show **connections both within subgraphs and between subgraphs**, if components interact.\n"
-            "- Use directional arrows to show communication flow, data flow, or dependency relationships.\n"
-            "- Label each node with concise, meaningful names (e.g., `React Frontend`, `Node.js API`, `Redis Cache`, `GitHub API`, `.env Config`, `Parser Module`, `CLI Entry Point`).\n\n"
-            "✅ Only output a valid Mermaid diagram inside a code block.\n"
-            "🚫 Do not include file paths, filenames, explanations, or extra markdown.\n\n"
-            "Example:\n\n"
-            "graph TD\n"
-            "  subgraph Frontend\n"
-            "    A[Next.js App]\n"
-            "  end\n"
-            "  subgraph Backend\n"
-            "    B[Express.js Server]\n"
-            "    B --> C[(PostgreSQL)]\n"
-            "    B --> D[Stripe API]\n"
-            "    B --> E[.env Configuration]\n"
-            "  end\n"
-            "  A --> B\n\n"
-            "Additional guidelines:\n"
-            "- If the context includes too much information, focus on the components most essential to the system’s functionality and architecture.\n"
-            "- %% Only include high-level logical components, not file names."
-            
-        ),
+        ("system", architecture_system_prompt),
         (
             "user",
             "Given the following codebase:\n\n"
@@ -122,33 +124,92 @@ def generate_diagram_with_rag(vector_store, model,index):
     ])
 
 
-    chain = architecture_prompt | model
-    readme = chain.invoke({"context": full_context}).content
+    return write_diagram(architecture_prompt | model, full_context, index, output_path)
+
+
+def write_diagram(chain, context, index, output_path=None, stream=None):
+    """
+    Runs `chain` (prompt | model) and writes the fence-stripped diagram. With
+    `stream` (default: `streaming.stream_outputs`) the response is streamed to
+    the file as it is generated.
+    """
+    output_path = output_path or f"mermaid_results/testing_mermaid_diagram_{str(index)}.md"
+    if streaming.stream_outputs if stream is None else stream:
+        with metrics.span("diagram"):
+            streaming.stream_to_file(chain.first, chain.last, {"context": context}, output_path, MermaidFenceFilter)
+        logger.info("[✅] Diagram streamed to %s", output_path)
+        return output_path
+
+    with metrics.span("diagram"):
+        readme = chain.invoke({"context": context}).content
     readme = clean_mermaid_output(readme)
 
-    with open(f"mermaid_results/testing_mermaid_diagram_{str(index)}.md", "w") as f:
-        f.write(readme)
+    atomic_write(output_path, readme)
 
-    print("[✅] README.md generated successfully with summarization.")
+    logger.info("[✅] Diagram written to %s", output_path)
+    return output_path
+
+
+def generate_diagram_from_graph(path, model, index, graph=None, output_path=None, files=None):
+    """
+    Generates the diagram from the static dependency graph of the repository
+    instead of retrieved chunks: a few hundred tokens of components, weighted
+    import edges and external packages, plus a baseline Mermaid graph for the
+    model to abstract. Unchanged code gives the same prompt and so hits the LLM
+    cache. `graph`, or the scanned `files`, can be passed in when they are
+    already known.
+    """
+    if graph is None:
+        logger.info("[🕸️] Extracting static dependency graph...")
+        with metrics.span("dep_graph"):
+            graph = build_graph(path, files=files)
+    context = (
+        f"{graph.summary()}\n\n"
+        "Baseline diagram derived from the imports (one node per package):\n"
+        f"{graph.to_mermaid()}"
+    )
+    logger.info("[🧮] Dependency graph context: %d tokens (%d modules, %d import edges)",
+                count_tokens(context, model_name_of(model)), len(graph.modules), len(graph.edges))
+
+    architecture_prompt = ChatPromptTemplate.from_messages([
+        ("system", architecture_system_prompt),
+        (
+            "user",
+            "Given the following static dependency analysis of the codebase "
+            "(package-level components, import counts between them and external packages):\n\n"
+            "{context}\n\n"
+        )
+    ])
+    return write_diagram(architecture_prompt | model, context, index, output_path)
 
 
 
 if __name__ == "__main__":
-    print("[🔍] Scanning files...")
+    configure_logging()
+    logger.info("[🔍] Scanning files...")
 
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-    vector_store = Chroma(
-        collection_name="codebase_name",
-        embedding_function=embeddings,
-        persist_directory="./vector_db",
-    )
+    model = get_model()
+    embeddings = get_embeddings()
+    llm_cache = enable_llm_cache()
 
+    # --resume skips repositories whose diagram a previous, interrupted run wrote
+    journal = RunJournal("diagram", resume="--resume" in sys.argv)
 
     for idx in range(len(paths)):
-        vector_store.reset_collection()
-
-        resultant_files = scan_subfolders(path=paths[idx])
-        read_files = read_contents(resultant_files)
-        documents, uuids = read_all_file_contents(read_files)
-        vector_store.add_documents(documents)
-        generate_diagram_with_rag(vector_store, model,idx)
+        if journal.is_done(paths[idx], "diagram"):
+            logger.info("[⏭️] Diagram already generated for %s", paths[idx])
+            continue
+        with metrics.span("repository", repo=paths[idx]):
+            if "--rag" not in sys.argv:
+                output = generate_diagram_from_graph(paths[idx], model, idx)
+            else:
+                vector_store = open_vector_store(paths[idx], embeddings)
+                index_repository(vector_store, paths[idx])
+                output = generate_diagram_with_rag(vector_store, model,idx)
+        journal.record(paths[idx], "diagram", output=output)
+    journal.close()
+
+    logger.info("[💾] Embedding cache: %s", embeddings.stats())
+    if llm_cache is not None:
+        logger.info(llm_cache.summary())
+    metrics.export()
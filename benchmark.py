@@ -0,0 +1,369 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmark_directory = "./benchmarks"
+
+# Language -> (extension, share of files) for the default mix
+default_languages = {"py": 0.35, "js": 0.25, "ts": 0.1, "go": 0.1, "java": 0.1, "json": 0.05, "yml": 0.05}
+
+
+def _python_file(rng, name, siblings, target_size):
+    lines = [f"from {sibling} import helper_{sibling}" for sibling in siblings] + ["import os", ""]
+    i = 0
+    while sum(len(line) + 1 for line in lines) < target_size:
+        if i % 4 == 3:
+            lines += [f"class Model{i}:", f"    def __init__(self, value):", f"        self.value = value + {i}", "",
+                      f"    def compute(self, factor):", f"        return self.value * factor", ""]
+        else:
+            lines += [f"def {name}_func_{i}(values):", "    total = 0", "    for value in values:",
+                      f"        total += value * {i}", "    return total", ""]
+        i += 1
+    lines += [f"def helper_{name}():", f"    return os.getcwd()", ""]
+    return "\n".join(lines)
+
+
+def _js_file(rng, name, siblings, target_size):
+    lines = [f"import {{ helper }} from './{sibling}';" for sibling in siblings] + ["import React from 'react';", ""]
+    i = 0
+    while sum(len(line) + 1 for line in lines) < target_size:
+        lines += [f"export function {name}Func{i}(values) {{", "  let total = 0;",
+                  f"  for (const value of values) {{ total += value * {i}; }}", "  return total;", "}", ""]
+        i += 1
+    lines += ["export const helper = () => 42;", ""]
+    return "\n".join(lines)
+
+
+def _go_file(rng, name, siblings, target_size):
+    lines = ["package main", "", "import (", '  "fmt"', '  "github.com/example/lib"', ")", ""]
+    i = 0
+    while sum(len(line) + 1 for line in lines) < target_size:
+        lines += [f"func {name.capitalize()}Func{i}(values []int) int {{", "  total := 0",
+                  f"  for _, v := range values {{ total += v * {i} }}", '  fmt.Println(lib.Name)', "  return total", "}", ""]
+        i += 1
+    return "\n".join(lines)
+
+
+def _java_file(rng, name, siblings, target_size):
+    cls = name.capitalize()
+    lines = ["package com.example.bench;", "", "import java.util.List;", "", f"public class {cls} {{"]
+    i = 0
+    while sum(len(line) + 1 for line in lines) < target_size:
+        lines += [f"    public int method{i}(List<Integer> values) {{", "        int total = 0;",
+                  f"        for (int v : values) {{ total += v * {i}; }}", "        return total;", "    }", ""]
+        i += 1
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def _data_file(rng, name, siblings, target_size, extension):
+    if extension == "json":
+        items = []
+        while len(json.dumps(items)) < target_size:
+            items.append({"name": f"{name}_{len(items)}", "value": rng.randint(0, 1000)})
+        return json.dumps(items, indent=2)
+    lines = []
+    while sum(len(line) + 1 for line in lines) < target_size:
+        lines.append(f"{name}_{len(lines)}: {rng.randint(0, 1000)}")
+    return "\n".join(lines)
+
+
+generators_by_extension = {"py": _python_file, "js": _js_file, "ts": _js_file, "go": _go_file, "java": _java_file}
+
+
+def generate_repository(root, files=1000, median_size=2000, size_sigma=1.0, languages=None, max_depth=4,
+                        dirs_per_level=4, gitignores=10, ignored_trees=2, ignored_tree_files=200, seed=0):
+    """
+    Writes a synthetic repository under `root` and returns its parameters and
+    counts. File sizes are log-normal around `median_size` bytes, languages are
+    drawn from `languages` ({extension: share}), and files are spread over a
+    directory tree up to `max_depth` levels deep. `gitignores` nested .gitignore
+    files each ignore some generated *.log files and a build/ folder, and
+    `ignored_trees` node_modules-style trees of `ignored_tree_files` files each
+    are excluded by the root .gitignore. The same seed gives the same repository.
+    """
+    rng = random.Random(seed)
+    languages = languages or default_languages
+    extensions, weights = zip(*languages.items())
+
+    directories = [""]
+    frontier = [""]
+    for depth in range(max_depth):
+        frontier = [f"{parent}pkg{depth}_{i}/" for parent in frontier for i in range(dirs_per_level)
+                    if rng.random() < 0.8 or parent == ""]
+        directories += frontier
+    counts = {"files": 0, "bytes": 0, "ignored_files": 0, "gitignores": 0}
+
+    by_directory = {}
+    for n in range(files):
+        extension = rng.choices(extensions, weights)[0]
+        directory = rng.choice(directories)
+        name = f"mod{n}"
+        size = max(64, int(rng.lognormvariate(0, size_sigma) * median_size))
+        siblings = [sibling for sibling, sibling_ext in by_directory.get(directory, [])[-3:] if sibling_ext == extension]
+        if extension in generators_by_extension:
+            text = generators_by_extension[extension](rng, name, siblings, size)
+        else:
+            text = _data_file(rng, name, siblings, size, extension)
+        path = os.path.join(root, directory, f"{name}.{extension}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        by_directory.setdefault(directory, []).append((name, extension))
+        counts["files"] += 1
+        counts["bytes"] += len(text)
+
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("node_modules/\n*.tmp\n")
+    # Nested only: the root .gitignore above holds the node_modules rule
+    for directory in rng.sample(directories[1:], min(gitignores, len(directories) - 1)):
+        os.makedirs(os.path.join(root, directory, "build"), exist_ok=True)
+        with open(os.path.join(root, directory, ".gitignore"), "w") as f:
+            f.write("*.log\nbuild/\n!keep.log\n")
+        for name in ("debug.log", "build/out.js", "keep.log"):
+            with open(os.path.join(root, directory, name), "w") as f:
+                f.write("ignored output\n")
+        counts["gitignores"] += 1
+        counts["ignored_files"] += 2
+
+    for tree in range(ignored_trees):
+        base = os.path.join(root, rng.choice(directories[:dirs_per_level + 1]), "node_modules")
+        for n in range(ignored_tree_files):
+            path = os.path.join(base, f"lib{tree}_{n // 20}", f"index{n}.js")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(f"module.exports = {n};\n")
+            counts["ignored_files"] += 1
+    return counts
+
+
+def measure(fn, repeat=3):
+    """
+    Runs `fn` `repeat` times with its output silenced. Returns its last result
+    and the timing summary.
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+    return result, {"runs": times, "min": min(times), "median": statistics.median(times), "max": max(times)}
+
+
+# Fresh-interpreter startup checks: CLI invocations and plain module imports
+startup_commands = {
+    "main --help": ["main.py", "--help"],
+    "main scan --help": ["main.py", "scan", "--help"],
+    "main scan": ["main.py", "scan", "--count", "{repo}"],
+}
+startup_imports = ("files", "rag_test", "inline_docs", "readme_generation", "archi_diagram", "pipeline")
+# Top-level packages that a pure scan should never load
+heavy_packages = ("langchain", "langchain_core", "langchain_openai", "langchain_chroma", "chromadb", "openai",
+                  "numpy", "tiktoken")
+
+
+def measure_startup(repo, repeat=5):
+    """
+    Median wall time of a fresh interpreter running each of `startup_commands`
+    and importing each of `startup_imports`. The heavy packages that the scan
+    command imports are reported from `-X importtime`.
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_dir, os.getenv("PYTHONPATH")])))
+    runs = {name: [os.path.join(package_dir, argv[0])] + [arg.format(repo=repo) for arg in argv[1:]]
+            for name, argv in startup_commands.items()}
+    runs.update({f"import {module}": ["-c", f"import {module}"] for module in startup_imports})
+
+    results = {}
+    for name, argv in runs.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        results[name] = {"runs": times, "min": min(times), "median": statistics.median(times), "max": max(times)}
+
+    trace = subprocess.run([sys.executable, "-X", "importtime"] + runs["main scan"], env=env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True).stderr
+    imported = {line.rsplit("|", 1)[-1].strip().split(".")[0] for line in trace.splitlines() if "|" in line}
+    results["main scan"]["heavy_imports"] = sorted(imported.intersection(heavy_packages))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(repo, args):
+    """
+    Runs every selected benchmark against the synthetic repository at `repo`
+    and returns {name: timing summary plus benchmark-specific counts}.
+    """
+    from fakes import FakeChatModel, FakeEmbeddings
+    from files import scan_subfolders, get_gitignored_contents, read_contents
+    from llm_engine import LLMScheduler, RateLimiter
+
+    results = {}
+    selected = set(args.only or ["startup", "scan", "gitignore", "read", "chunk", "vector_store", "docs", "readme",
+                                 "diagram"])
+    if "startup" in selected:
+        for name, timing in measure_startup(repo, max(args.repeat, 5)).items():
+            results[f"startup[{name}]"] = timing
+
+    def fake_model():
+        return FakeChatModel(min_latency=args.latency, max_latency=args.latency * 2,
+                             error_rate=args.error_rate, seed=args.seed)
+
+    def fast_scheduler():
+        # No rate limits, and short backoff so injected errors cost retries, not minutes
+        return LLMScheduler(args.concurrency, RateLimiter(), base_delay=0.05, max_delay=0.5)
+
+    files, timing = measure(lambda: scan_subfolders(repo), args.repeat)
+    if "scan" in selected:
+        results["scan_subfolders"] = dict(timing, files=len(files))
+    if "gitignore" in selected:
+        ignored, timing = measure(lambda: get_gitignored_contents(repo), args.repeat)
+        results["get_gitignored_contents"] = dict(timing, ignored=len(ignored))
+
+    records, timing = measure(lambda: read_contents(files), args.repeat)
+    if "read" in selected:
+        results["read_contents"] = dict(timing, files=len(records), bytes=sum(len(r["contents"]) for r in records))
+
+    documents = []
+    if selected & {"chunk", "vector_store", "readme"}:
+        from rag_test import read_all_file_contents
+
+        for splitter in ("code", "character"):
+            (docs, ids), timing = measure(lambda: read_all_file_contents(records, splitter=splitter), args.repeat)
+            if "chunk" in selected:
+                results[f"read_all_file_contents[{splitter}]"] = dict(timing, chunks=len(docs))
+            if splitter == "code":
+                documents = (docs, ids)
+
+    vector_store = None
+    if selected & {"vector_store", "readme"}:
+        from numpy_store import NumpyVectorStore
+
+        docs, ids = documents
+        embeddings = FakeEmbeddings(size=args.embedding_size, latency_per_text=args.embedding_latency)
+        vector_store, timing = measure(
+            lambda: NumpyVectorStore.from_texts([d.page_content for d in docs], embeddings,
+                                                [d.metadata for d in docs], ids=ids), args.repeat)
+        if "vector_store" in selected:
+            results["vector_store_insert"] = dict(timing, chunks=len(docs), backend="numpy")
+            queries = [d.page_content for d in docs[:50]]
+            _, timing = measure(lambda: [vector_store.similarity_search(q, k=50) for q in queries], args.repeat)
+            results["vector_store_query"] = dict(timing, queries=len(queries), k=50, backend="numpy")
+
+    if "docs" in selected:
+        from inline_docs import run_all
+
+        model = fake_model()
+        report, timing = measure(
+            lambda: asyncio.run(run_all(records, llm=model, scheduler=fast_scheduler())), 1)
+        results["inline_docs"] = dict(timing, files=len(records), requests=model.calls, errors=model.errors,
+                                      failed_files=len(report["failed_files"]), p95=report["p95"])
+    if "readme" in selected:
+        from readme_generation import generate_readme_with_rag
+
+        model = fake_model()
+        _, timing = measure(lambda: generate_readme_with_rag(vector_store, model, 0, output_path="bench/README.md"), 1)
+        results["readme"] = dict(timing, requests=model.calls)
+    if "diagram" in selected:
+        from archi_diagram import generate_diagram_from_graph
+
+        model = fake_model()
+        _, timing = measure(lambda: generate_diagram_from_graph(repo, model, 0, output_path="bench/diagram.md"), 1)
+        results["diagram"] = dict(timing, requests=model.calls)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks on a synthetic repository with fake backends.")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--median-size", type=int, default=2000, help="median file size in bytes")
+    parser.add_argument("--size-sigma", type=float, default=1.0, help="log-normal spread of file sizes")
+    parser.add_argument("--languages", default=None, help='JSON share per extension, e.g. \'{"py": 0.5, "js": 0.5}\'')
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--gitignores", type=int, default=10)
+    parser.add_argument("--ignored-trees", type=int, default=2)
+    parser.add_argument("--ignored-tree-files", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="minimum fake LLM latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of fake LLM calls that fail")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="fake embedding seconds per text")
+    parser.add_argument("--embedding-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="startup scan gitignore read chunk vector_store docs readme diagram")
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/<time>_<commit>.json)")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic repository")
+    args = parser.parse_args(argv)
+
+    os.environ["LLM_CACHE"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from metrics import metrics
+
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    repo = os.path.join(workdir, "repo")
+    output = os.path.abspath(args.output) if args.output else None
+    cwd = os.getcwd()
+    try:
+        start = time.perf_counter()
+        repository = generate_repository(
+            repo, args.files, args.median_size, args.size_sigma,
+            json.loads(args.languages) if args.languages else None, args.depth,
+            gitignores=args.gitignores, ignored_trees=args.ignored_trees,
+            ignored_tree_files=args.ignored_tree_files, seed=args.seed,
+        )
+        repository["generated_in"] = time.perf_counter() - start
+        # Outputs of the full runs (doc_results/, bench/) go to the scratch directory
+        os.chdir(workdir)
+        results = run_benchmarks(repo, args)
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "keep")},
+        "repository": repository,
+        "results": results,
+        # Counters and histograms recorded by the instrumented stages during the runs
+        "metrics": metrics.report(),
+    }
+    if output is None:
+        os.makedirs(benchmark_directory, exist_ok=True)
+        output = os.path.join(benchmark_directory, f"{time.strftime('%Y%m%d_%H%M%S')}_{report['commit'] or 'nogit'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in results.items():
+        print(f"[⏱️] {name:<38} median {result['median']:8.3f}s")
+    print(f"[💾] Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
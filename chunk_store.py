@@ -0,0 +1,273 @@
+import mmap
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+from langchain_core.documents import Document
+
+from chunking import chunk_code, split_lines
+
+
+def translate_newlines(text):
+    """
+    The universal-newline translation of text-mode reads, so chunk text matches
+    what `files.read_file` returns.
+    """
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
+
+
+class ChunkStore:
+    """
+    Compact, column-oriented store of the chunks of many files. A chunk is one
+    row of parallel `array` columns: file id, byte range in the file, line
+    range, index in its file, and interned symbol and kind. That costs about 40
+    bytes per chunk, and no text is kept. Chunk text is decoded from a
+    memory-mapped view of the file only when it is asked for, so a consumer that
+    works batch by batch holds one batch of text at a time.
+
+    Files are mapped once when added, to chunk them with `chunking.chunk_code`,
+    and the maps of the most recently used `max_open_files` stay open. Each
+    file must stay unchanged until its chunks are read back, and a change
+    in its size is reported as an error. A store can be pickled (its maps are
+    reopened on demand), for example to send it back from a worker process.
+    """
+
+    def __init__(self, max_open_files=64):
+        self.max_open_files = max_open_files
+        # Per file
+        self.paths = []
+        self.extensions = []
+        self.sizes = array("Q")
+        self.translated = array("B")
+        # Per chunk
+        self.file_ids = array("I")
+        self.starts = array("Q")
+        self.ends = array("Q")
+        self.start_lines = array("I")
+        self.end_lines = array("I")
+        self.file_chunk_ids = array("I")
+        self.symbols = array("I")
+        self.kinds = array("I")
+        # Interned strings for the symbol and kind columns
+        self.strings = [""]
+        self._string_ids = {"": 0}
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    def _intern(self, value):
+        idx = self._string_ids.get(value)
+        if idx is None:
+            idx = self._string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return idx
+
+    def add_file(self, path, max_tokens=512, accept=None):
+        """
+        Reads and chunks the file at `path` and records its chunks. `accept`,
+        if given, is called with the path and the (newline-translated) text
+        first, and the file is skipped when it returns False. Returns the
+        number of chunks added. Raises OSError or UnicodeDecodeError, like
+        `files.read_file`, for a file that cannot be read.
+        """
+        with self._lock:
+            raw = str(self._open(path), "utf-8")
+        text = translate_newlines(raw)
+        if accept is not None and accept(path, text) is False:
+            return 0
+        chunks = chunk_code(text, os.path.splitext(path)[1].lstrip("."), max_tokens)
+        if not chunks:
+            return 0
+
+        # Byte offset of every line start in the file on disk. Translation keeps
+        # the line structure, so line numbers in `text` index the raw lines too.
+        offsets = [0]
+        for line in split_lines(raw):
+            offsets.append(offsets[-1] + (len(line) if line.isascii() else len(line.encode("utf-8"))))
+
+        file_id = len(self.paths)
+        self.paths.append(path)
+        self.extensions.append(os.path.splitext(path)[1].lstrip("."))
+        self.sizes.append(offsets[-1])
+        self.translated.append(raw is not text)
+        for idx, chunk in enumerate(chunks):
+            self.file_ids.append(file_id)
+            self.starts.append(offsets[chunk["start_line"] - 1])
+            self.ends.append(offsets[chunk["end_line"]])
+            self.start_lines.append(chunk["start_line"])
+            self.end_lines.append(chunk["end_line"])
+            self.file_chunk_ids.append(idx)
+            self.symbols.append(self._intern(chunk["symbol"]))
+            self.kinds.append(self._intern(chunk["kind"]))
+        return len(chunks)
+
+    def _open(self, path):
+        """
+        Read-only map of the file at `path`, kept in the LRU of open maps. An
+        empty file (which cannot be mapped) is an empty bytes object.
+        """
+        view = self._maps.get(path)
+        if view is not None:
+            self._maps.move_to_end(path)
+            return view
+        with open(path, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return b""
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[path] = view
+        if len(self._maps) > self.max_open_files:
+            self._maps.popitem(last=False)[1].close()
+        return view
+
+    def _map(self, file_id):
+        path = self.paths[file_id]
+        view = self._open(path)
+        if len(view) != self.sizes[file_id]:
+            stale = self._maps.pop(path, None)
+            if stale is not None:
+                stale.close()
+            raise ValueError(f"{path} changed since it was chunked")
+        return view
+
+    def text(self, row):
+        file_id = self.file_ids[row]
+        # Batches of one store are materialized on several threads; the lock
+        # keeps a map from being evicted and closed while it is being sliced
+        with self._lock:
+            data = self._map(file_id)[self.starts[row]:self.ends[row]]
+        text = data.decode("utf-8")
+        return translate_newlines(text) if self.translated[file_id] else text
+
+    def metadata(self, row):
+        """
+        The metadata `rag_test.iter_documents` gives the same chunk, with the row
+        as its "id".
+        """
+        file_id = self.file_ids[row]
+        return {
+            "source": self.paths[file_id],
+            "extension": self.extensions[file_id],
+            "file_chunk_id": self.file_chunk_ids[row],
+            "id": row,
+            "symbol": self.strings[self.symbols[row]],
+            "kind": self.strings[self.kinds[row]],
+            "start_line": self.start_lines[row],
+            "end_line": self.end_lines[row],
+        }
+
+    def document(self, row):
+        return Document(page_content=self.text(row), metadata=self.metadata(row))
+
+    def documents(self, rows=None):
+        """
+        Materializes the Documents of `rows` (default: all), e.g. one embedding
+        batch.
+        """
+        return [self.document(row) for row in (range(len(self)) if rows is None else rows)]
+
+    def iter_documents(self, rows=None):
+        for row in range(len(self)) if rows is None else rows:
+            yield self.document(row)
+
+    def byte_size(self, rows=None):
+        """
+        Bytes of source text covered by `rows` (default: all), for sizing
+        requests without decoding them.
+        """
+        if rows is None:
+            return sum(self.ends) - sum(self.starts)
+        return sum(self.ends[row] - self.starts[row] for row in rows)
+
+    def memory_bytes(self):
+        """
+        Approximate memory held by the columns and string tables (not the
+        maps, which are backed by the page cache).
+        """
+        columns = (self.sizes, self.translated, self.file_ids, self.starts, self.ends, self.start_lines,
+                   self.end_lines, self.file_chunk_ids, self.symbols, self.kinds)
+        strings = sum(len(s) + 49 for s in self.strings + self.paths + self.extensions)
+        return sum(column.itemsize * len(column) for column in columns) + strings
+
+    def close(self):
+        with self._lock:
+            while self._maps:
+                self._maps.popitem()[1].close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_maps"], state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __del__(self):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import resource
+    import subprocess
+    import sys
+    import tempfile
+    import time
+
+    # Peak-RSS comparison of the two ways to take a repository to embedding
+    # batches: Document lists for the whole corpus (read_all_file_contents),
+    # and a ChunkStore materialized one batch at a time. Each mode runs in a
+    # fresh process, so ru_maxrss is its own peak.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?", help="repository (default: a synthetic one)")
+    parser.add_argument("--files", type=int, default=5000, help="files of the synthetic repository")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--mode", choices=("documents", "store"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        from files import scan_subfolders
+
+        files = scan_subfolders(args.path)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        if args.mode == "documents":
+            from files import read_contents
+            from rag_test import read_all_file_contents
+
+            documents, ids = read_all_file_contents(read_contents(files), dedupe=False)
+            chunks = len(documents)
+            for offset in range(0, chunks, args.batch_size):
+                batch = [doc.page_content for doc in documents[offset:offset + args.batch_size]]
+        else:
+            store = ChunkStore()
+            for file in files:
+                try:
+                    store.add_file(file)
+                except (OSError, UnicodeDecodeError):
+                    continue
+            chunks = len(store)
+            for offset in range(0, chunks, args.batch_size):
+                batch = [doc.page_content for doc in store.documents(range(offset, min(offset + args.batch_size, chunks)))]
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KiB on Linux
+        print(f"{chunks} {elapsed:.3f} {(peak - baseline) / 1024:.1f}")
+        sys.exit()
+
+    path = args.path
+    if path is None:
+        from benchmark import generate_repository
+
+        path = tempfile.mkdtemp(prefix="chunk_store_")
+        repository = generate_repository(path, files=args.files, ignored_trees=0)
+        print(f"[🏗️] Synthetic repository: {repository['files']} files, {repository['bytes'] / 2**20:.1f} MiB")
+    for mode in ("documents", "store"):
+        out = subprocess.run([sys.executable, __file__, path, "--mode", mode, "--batch-size", str(args.batch_size)],
+                             capture_output=True, text=True, check=True).stdout.split()
+        chunks, elapsed, peak = out[-3:]
+        print(f"[🧠] {mode:>9}: {chunks} chunks in {float(elapsed):.2f}s, peak RSS +{float(peak):.1f} MiB")
@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import os
+
+from tokens import count_tokens, model_name_of
+
+logger = logging.getLogger(__name__)
+
+key_extensions = {
+    ".py", ".js", ".ts", ".java", ".cs", ".cpp", ".c", ".go", ".rb", ".php",
+    ".rs", ".kt", ".swift", ".scala", ".sh", ".pl", ".dart", ".html", ".css",
+    ".json", ".xml", ".yml", ".yaml", ".sql", ".jsx", ".tsx",
+}
+
+
+def retrieve_context(vector_store, query, model, k=50, max_tokens=8000, use_mmr=False, fetch_k=None):
+    """
+    Retrieves the top `k` chunks for `query` (with MMR diversity if `use_mmr`)
+    and packs them into a context string of at most `max_tokens` tokens for the
+    model that will receive it.
+    """
+    if use_mmr:
+        results = vector_store.max_marginal_relevance_search(query, k=k, fetch_k=fetch_k or k * 4)
+    else:
+        results = vector_store.similarity_search(query=query, k=k)
+    context, stats = build_context(results, max_tokens, model_name_of(model))
+    logger.info(
+        "[🧮] Context: sent %d of %d retrieved tokens (%d chunks from %d files, %d dropped)",
+        stats["sent_tokens"], stats["retrieved_tokens"], stats["chunks"], stats["files"], stats["dropped_chunks"],
+    )
+    return context
+
+
+def build_context(docs, max_tokens=8000, model_name="gpt-3.5-turbo", extensions=key_extensions):
+    """
+    Turns retrieved Documents into one prompt context:
+    - keeps only chunks whose extension is in `extensions`,
+    - drops exact duplicate chunks,
+    - groups chunks by source file in relevance order, puts each group in file
+      order, and merges neighbouring chunks while removing their overlap,
+    - packs the groups, each under a short file header, until `max_tokens` is reached.
+
+    Returns (context, stats), where stats compares retrieved and sent tokens.
+    """
+    stats = {"retrieved_tokens": 0, "sent_tokens": 0, "chunks": 0, "files": 0, "dropped_chunks": 0}
+    seen = set()
+    groups = {}
+    for doc in docs:
+        stats["retrieved_tokens"] += count_tokens(doc.page_content, model_name)
+        ext = doc.metadata.get("extension", "").lower()
+        if ext and not ext.startswith("."):
+            ext = "." + ext
+        digest = hashlib.sha1(doc.page_content.strip().encode("utf-8")).digest()
+        if ext not in extensions or digest in seen:
+            stats["dropped_chunks"] += 1
+            continue
+        seen.add(digest)
+        groups.setdefault(doc.metadata.get("source", ""), []).append(doc)
+
+    sources = [source for source in groups if source]
+    root = os.path.commonpath(sources) if len(sources) > 1 else os.path.dirname(sources[0]) if sources else ""
+
+    parts = []
+    used = 0
+    # Blocks are joined with "\n", which costs tokens of its own
+    separator_tokens = count_tokens("\n", model_name)
+    for source, group in groups.items():
+        name = os.path.relpath(source, root) if root and source else source
+        added = False
+        for start_line, end_line, text in _merge_group(group):
+            lines = f" (lines {start_line}-{end_line})" if start_line else ""
+            block = f"### {name}{lines}\n{text.strip()}\n"
+            tokens = count_tokens(block, model_name) + (separator_tokens if parts else 0)
+            if used + tokens > max_tokens:
+                stats["dropped_chunks"] += 1
+                continue
+            parts.append(block)
+            used += tokens
+            stats["chunks"] += 1
+            added = True
+        if added:
+            stats["files"] += 1
+
+    stats["sent_tokens"] = used
+    return "\n".join(parts), stats
+
+
+def _merge_group(group):
+    """
+    Sorts one file's chunks into file order and merges runs of adjacent chunks,
+    trimming the text they overlap on. Chunks with line numbers are only
+    trimmed when their line ranges overlap; merely touching ones are joined
+    whole. Yields (start_line, end_line, text);
+    line numbers are None when the chunks do not carry them.
+    """
+    group = sorted(group, key=lambda d: (d.metadata.get("start_line") or 0, d.metadata.get("file_chunk_id", 0)))
+    current = None
+    for doc in group:
+        meta = doc.metadata
+        if current is not None and _adjacent(current["last"], meta):
+            overlap = _overlap(current["text"], doc.page_content) if _overlapping(current["last"], meta) else 0
+            if not overlap and not current["text"].endswith("\n"):
+                current["text"] += "\n"
+            current["text"] += doc.page_content[overlap:]
+            current["end_line"] = meta.get("end_line", current["end_line"])
+            current["last"] = meta
+            continue
+        if current is not None:
+            yield current["start_line"], current["end_line"], current["text"]
+        current = {"text": doc.page_content, "start_line": meta.get("start_line"),
+                   "end_line": meta.get("end_line"), "last": meta}
+    if current is not None:
+        yield current["start_line"], current["end_line"], current["text"]
+
+
+def _adjacent(prev, meta):
+    if "end_line" in prev and "start_line" in meta:
+        return meta["start_line"] <= prev["end_line"] + 1
+    if "file_chunk_id" in prev and "file_chunk_id" in meta:
+        return meta["file_chunk_id"] == prev["file_chunk_id"] + 1
+    return False
+
+
+def _overlapping(prev, meta):
+    if "end_line" in prev and "start_line" in meta:
+        return meta["start_line"] <= prev["end_line"]
+    # Without line numbers, only the text can tell
+    return True
+
+
+def _overlap(prev_text, next_text, max_overlap=1000):
+    """
+    Length of the longest suffix of `prev_text` that is also a prefix of `next_text`.
+    """
+    limit = min(len(prev_text), len(next_text), max_overlap)
+    for size in range(limit, 0, -1):
+        if prev_text.endswith(next_text[:size]):
+            return size
+    return 0
@@ -0,0 +1,187 @@
+import hashlib
+import re
+import zlib
+
+import numpy as np
+
+from tokens import count_tokens
+
+token_pattern = re.compile(r"\w+|[^\w\s]")
+# Prime above 2**32 for the universal hash family of the MinHash permutations
+mersenne_prime = (1 << 61) - 1
+
+
+def normalize_chunk(text):
+    """
+    Whitespace-insensitive form of a chunk: reindented or rewrapped copies
+    of the same code hash equal.
+    """
+    return " ".join(text.split())
+
+
+def lsh_bands(num_perm, threshold):
+    """
+    Splits `num_perm` signature rows into (bands, rows) so that the LSH
+    collision-probability curve crosses 50% close to `threshold`.
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+class ChunkDeduplicator:
+    """
+    Streaming exact and near-duplicate filter for chunk Documents.
+
+    Exact duplicates are matched by the hash of their normalized text. Near
+    duplicates are matched by MinHash over `shingle_size`-token shingles,
+    with LSH banding to find candidates. A candidate counts only if its
+    estimated Jaccard similarity is at least `threshold`. Chunks with fewer than
+    `min_shingles` shingles are only matched exactly.
+
+    Each chunk costs O(tokens) plus a constant number of bucket lookups, so a
+    run scales linearly with the number of chunks.
+
+    The first chunk seen is kept. Every later duplicate is recorded as an alias
+    "source:start-end" of the kept chunk, under `key(doc)` of that chunk, and
+    `aliases_metadata()` turns these into metadata values.
+    """
+
+    def __init__(self, threshold=0.85, num_perm=128, shingle_size=5, min_shingles=8, key=None, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.min_shingles = min_shingles
+        self.key = key or (lambda doc: (doc.metadata.get("source"), doc.metadata.get("file_chunk_id")))
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+        self._exact = {}
+        self._buckets = {}
+        self._signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        # (key, source) of every kept chunk, by kept index
+        self._kept = []
+
+        # Kept chunk key -> list of alias strings; duplicate source -> sources it duplicates
+        self.aliases = {}
+        self.duplicate_sources = {}
+        # Kept chunk key -> (its source, sources of its aliases)
+        self.alias_sources = {}
+        self.stats = {"chunks": 0, "kept": 0, "exact": 0, "near": 0, "removed_tokens": 0}
+
+    def filter(self, documents):
+        """
+        Yields the Documents that are not duplicates of an earlier one.
+        """
+        for doc in documents:
+            self.stats["chunks"] += 1
+            normalized = normalize_chunk(doc.page_content)
+            digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+            match = self._exact.get(digest)
+            kind = "exact"
+            signature = None
+            if match is None:
+                signature = self._signature(normalized)
+                if signature is not None:
+                    match = self._near_match(signature)
+                    kind = "near"
+            if match is not None:
+                self._record(doc, match, kind)
+                continue
+
+            index = len(self._kept)
+            self._kept.append((self.key(doc), doc.metadata.get("source", "")))
+            self._exact[digest] = index
+            if signature is not None:
+                self._store(index, signature)
+            self.stats["kept"] += 1
+            yield doc
+
+    def _signature(self, normalized):
+        tokens = token_pattern.findall(normalized)
+        count = len(tokens) - self.shingle_size + 1
+        if count < self.min_shingles:
+            return None
+        shingles = np.fromiter(
+            (zlib.crc32(" ".join(tokens[i:i + self.shingle_size]).encode("utf-8")) for i in range(count)),
+            dtype=np.uint64, count=count,
+        )
+        hashed = (self._a * shingles + self._b) % mersenne_prime
+        return (hashed.min(axis=1) & 0xFFFFFFFF).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def _near_match(self, signature):
+        seen = set()
+        for band_key in self._band_keys(signature):
+            candidate = self._buckets.get(band_key)
+            if candidate is None or candidate in seen:
+                continue
+            seen.add(candidate)
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                return candidate
+        return None
+
+    def _store(self, index, signature):
+        if index >= len(self._signatures):
+            grown = np.zeros((len(self._signatures) * 2, self.num_perm), dtype=np.uint32)
+            grown[:len(self._signatures)] = self._signatures
+            self._signatures = grown
+        self._signatures[index] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, index)
+
+    def _record(self, doc, index, kind):
+        meta = doc.metadata
+        source = meta.get("source", "")
+        lines = f":{meta['start_line']}-{meta['end_line']}" if "start_line" in meta else ""
+        kept_key, kept_source = self._kept[index]
+        self.aliases.setdefault(kept_key, []).append(f"{source}{lines}")
+        self.alias_sources.setdefault(kept_key, (kept_source, set()))[1].add(source)
+        if kept_source != source:
+            self.duplicate_sources.setdefault(source, set()).add(kept_source)
+        self.stats[kind] += 1
+        self.stats["removed_tokens"] += count_tokens(doc.page_content)
+
+    def __getstate__(self):
+        # Only the results travel back from a worker process; the lookup
+        # structures are large, and the default key function cannot be pickled
+        state = self.__dict__.copy()
+        for name in ("key", "_a", "_b", "_exact", "_buckets", "_signatures", "_kept"):
+            state.pop(name, None)
+        return state
+
+    def aliases_metadata(self, key):
+        """
+        Metadata fields for a kept chunk. Aliases are joined into a string
+        because vector store metadata values must be scalars.
+        """
+        aliases = self.aliases.get(key, [])
+        return {"aliases": ", ".join(aliases), "alias_count": len(aliases)} if aliases else {}
+
+    def summary(self):
+        s = self.stats
+        removed = s["exact"] + s["near"]
+        return (f"[🧬] Dedupe: removed {removed} of {s['chunks']} chunks "
+                f"({s['exact']} exact, {s['near']} near), ~{s['removed_tokens']} tokens not embedded")
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from files import scan_subfolders, iter_contents
+    from rag_test import iter_documents
+
+    # Duplicate report and throughput on the repository given as argument; the
+    # cost per chunk is constant, so chunks/s should hold as repositories grow
+    documents = list(iter_documents(iter_contents(scan_subfolders(sys.argv[1] if len(sys.argv) > 1 else "."))))
+    deduplicator = ChunkDeduplicator()
+    start = time.perf_counter()
+    kept = sum(1 for _ in deduplicator.filter(documents))
+    elapsed = time.perf_counter() - start
+    print(deduplicator.summary())
+    print(f"[⏱️] {len(documents)} chunks in {elapsed:.2f}s ({len(documents) / max(elapsed, 1e-9):.0f} chunks/s)")
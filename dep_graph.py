@@ -0,0 +1,389 @@
+import ast
+import concurrent.futures
+import os
+import posixpath
+import re
+import sys
+
+from chunking import symbol_pattern
+from files import scan_subfolders, read_file
+
+js_extensions = {"js", "jsx", "ts", "tsx", "mjs", "cjs", "vue", "svelte"}
+js_resolve_suffixes = [
+    "", ".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs", ".vue", ".svelte",
+    "/index.ts", "/index.tsx", "/index.js", "/index.jsx",
+]
+
+js_import_pattern = re.compile(
+    r"""(?:\bimport\s+(?:[\w*${}\s,]+\s+from\s+)?|\bexport\s+[\w*${}\s,]+\s+from\s+|\brequire\s*\(\s*|\bimport\s*\(\s*)"""
+    r"""['"]([^'"\n]+)['"]"""
+)
+go_import_block_pattern = re.compile(r"^import\s*\((.*?)^\)", re.S | re.M)
+go_import_line_pattern = re.compile(r'^import\s+(?:[\w.]+\s+)?"([^"]+)"', re.M)
+go_import_spec_pattern = re.compile(r'(?:[\w.]+\s+)?"([^"]+)"')
+java_package_pattern = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.M)
+java_import_pattern = re.compile(r"^\s*import\s+(?:static\s+)?([\w.]+(?:\.\*)?)\s*;", re.M)
+node_builtins = {
+    "assert", "buffer", "child_process", "cluster", "crypto", "dns", "events", "fs", "http",
+    "https", "net", "os", "path", "process", "querystring", "readline", "stream", "url", "util",
+    "worker_threads", "zlib",
+}
+
+
+def extract_module(root, rel_path):
+    """
+    Parses one file and returns {"path", "language", "imports", "symbols",
+    "package"}. Imports are raw and still unresolved: (module, names, level)
+    triples for Python, specifier strings for the other languages.
+    Runs in a worker process, so it only takes and returns plain data.
+    """
+    res = {"path": rel_path, "language": None, "imports": [], "symbols": [], "package": None}
+    extension = posixpath.splitext(rel_path)[1].lstrip(".")
+    if extension not in ("py", "go", "java") and extension not in js_extensions:
+        return res
+    try:
+        contents = read_file(os.path.join(root, rel_path))["contents"]
+    except (OSError, UnicodeDecodeError):
+        return res
+
+    if extension == "py":
+        res["language"] = "python"
+        try:
+            tree = ast.parse(contents)
+        except (SyntaxError, ValueError):
+            return res
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                res["imports"].extend((alias.name, [], 0) for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                res["imports"].append((node.module or "", [alias.name for alias in node.names], node.level))
+        res["symbols"] = [
+            node.name for node in tree.body
+            if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) and not node.name.startswith("_")
+        ]
+        return res
+
+    if extension == "go":
+        res["language"] = "go"
+        for block in go_import_block_pattern.findall(contents):
+            res["imports"].extend(go_import_spec_pattern.findall(block))
+        res["imports"].extend(go_import_line_pattern.findall(contents))
+    elif extension == "java":
+        res["language"] = "java"
+        package = java_package_pattern.search(contents)
+        res["package"] = package.group(1) if package else ""
+        res["imports"] = java_import_pattern.findall(contents)
+    else:
+        res["language"] = "javascript"
+        res["imports"] = js_import_pattern.findall(contents)
+
+    # Top-level declarations only, as in the chunker's symbol guess
+    for line in contents.splitlines():
+        if line[:1].isspace() or not line.strip():
+            continue
+        m = symbol_pattern.search(line)
+        if m and m.group(2) not in res["symbols"]:
+            res["symbols"].append(m.group(2))
+    return res
+
+
+def component_of(target, depth=2):
+    """
+    Package-level component of a module: its directory cut to `depth` levels.
+    Targets ending in "/" are directories (Go packages, Python packages).
+    """
+    rel_dir = target.rstrip("/") if target.endswith("/") else posixpath.dirname(target)
+    if not rel_dir:
+        return "(root)"
+    return "/".join(rel_dir.split("/")[:depth])
+
+
+class DependencyGraph:
+    """
+    Module-level import graph of one repository and its collapse into
+    package-level components.
+
+    - `modules`: {rel_path: {"language", "symbols"}}
+    - `edges`: {(importer, imported): count}, where imported is a file or a "dir/"
+    - `externals`: {importer: {package: count}} for imports outside the repository
+
+    A repository with fewer than `min_components` components (a flat one is a
+    single "(root)") is shown module by module instead.
+    """
+
+    def __init__(self, root, depth=2, min_components=3):
+        self.root = root
+        self.depth = depth
+        self.min_components = min_components
+        self.modules = {}
+        self.edges = {}
+        self.externals = {}
+
+    def components(self):
+        """
+        Returns (nodes, edges, externals): {component: {"files", "symbols"}},
+        {(from, to): weight} without self-loops and {component: {package: count}}.
+        """
+        depth = self.depth
+        if len({component_of(rel_path, depth) for rel_path in self.modules}) < self.min_components:
+            depth = None
+        group = (lambda target: target) if depth is None else (lambda target: component_of(target, depth))
+        nodes = {}
+        for rel_path, module in self.modules.items():
+            node = nodes.setdefault(group(rel_path), {"files": 0, "symbols": []})
+            node["files"] += 1
+            node["symbols"].extend(module["symbols"])
+        edges = {}
+        for (importer, imported), count in self.edges.items():
+            pair = (group(importer), group(imported))
+            if pair[0] != pair[1]:
+                nodes.setdefault(pair[1], {"files": 0, "symbols": []})
+                edges[pair] = edges.get(pair, 0) + count
+        externals = {}
+        for importer, packages in self.externals.items():
+            counts = externals.setdefault(group(importer), {})
+            for package, count in packages.items():
+                counts[package] = counts.get(package, 0) + count
+        return nodes, edges, externals
+
+    def summary(self, max_components=30, max_edges=60, max_symbols=6, max_externals=15):
+        """
+        Compact, deterministic text description of the component graph for a prompt.
+        """
+        nodes, edges, externals = self.components()
+        ranked = sorted(nodes, key=lambda name: (-nodes[name]["files"], name))[:max_components]
+        lines = ["Components (files: main symbols):"]
+        for name in sorted(ranked):
+            symbols = ", ".join(sorted(set(nodes[name]["symbols"]))[:max_symbols])
+            lines.append(f"- {name} ({nodes[name]['files']} files){': ' + symbols if symbols else ''}")
+
+        kept = set(ranked)
+        top_edges = sorted(
+            ((pair, weight) for pair, weight in edges.items() if pair[0] in kept and pair[1] in kept),
+            key=lambda item: (-item[1], item[0]),
+        )[:max_edges]
+        lines.append("")
+        lines.append("Dependencies (importer -> imported: import count):")
+        lines.extend(f"- {a} -> {b}: {weight}" for (a, b), weight in sorted(top_edges))
+
+        totals = {}
+        for packages in externals.values():
+            for package, count in packages.items():
+                totals[package] = totals.get(package, 0) + count
+        top_packages = sorted(totals, key=lambda p: (-totals[p], p))[:max_externals]
+        if top_packages:
+            lines.append("")
+            lines.append("External packages (import count): " + ", ".join(f"{p} ({totals[p]})" for p in top_packages))
+        return "\n".join(lines)
+
+    def to_mermaid(self, max_components=30, max_edges=60, max_externals=8):
+        """
+        Baseline Mermaid diagram of the component graph. Node IDs and ordering
+        are derived from the sorted names, so unchanged code gives the same text.
+        """
+        nodes, edges, externals = self.components()
+        ranked = sorted(sorted(nodes, key=lambda name: (-nodes[name]["files"], name))[:max_components])
+        ids = {name: f"c{i}" for i, name in enumerate(ranked)}
+        lines = ["graph TD"]
+        lines.extend(f'  {ids[name]}["{name}"]' for name in ranked)
+        top_edges = sorted(
+            ((pair, weight) for pair, weight in edges.items() if pair[0] in ids and pair[1] in ids),
+            key=lambda item: (-item[1], item[0]),
+        )[:max_edges]
+        lines.extend(f"  {ids[a]} -->|{weight}| {ids[b]}" for (a, b), weight in sorted(top_edges))
+
+        totals = {}
+        for component, packages in externals.items():
+            for package, count in packages.items():
+                totals[package] = totals.get(package, 0) + count
+        top_packages = sorted(sorted(totals, key=lambda p: (-totals[p], p))[:max_externals])
+        if top_packages:
+            external_ids = {package: f"e{i}" for i, package in enumerate(top_packages)}
+            lines.append("  subgraph External")
+            lines.extend(f'    {external_ids[p]}[("{p}")]' for p in top_packages)
+            lines.append("  end")
+            for component in sorted(externals):
+                for package in sorted(externals[component]):
+                    if component in ids and package in external_ids:
+                        lines.append(f"  {ids[component]} --> {external_ids[package]}")
+        return "\n".join(lines)
+
+
+def build_graph(path, depth=2, max_workers=None, min_parallel_files=64, files=None):
+    """
+    Extracts imports and top-level symbols of every scanned file on a process
+    pool, then resolves imports against the repository's own files. Small
+    repositories are parsed in-process, where pool start-up would dominate.
+    `files` can pass in the result of `scan_subfolders(path)`.
+    """
+    root = os.path.realpath(path)
+    rel_paths = sorted(
+        os.path.relpath(file, root).replace(os.sep, "/") for file in (scan_subfolders(path) if files is None else files)
+    )
+    if len(rel_paths) < min_parallel_files:
+        extracted = [extract_module(root, rel_path) for rel_path in rel_paths]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+            extracted = list(pool.map(extract_module, [root] * len(rel_paths), rel_paths, chunksize=16))
+
+    graph = DependencyGraph(root, depth)
+    resolver = _Resolver(root, [module for module in extracted if module["language"]])
+    for module in extracted:
+        if not module["language"]:
+            continue
+        graph.modules[module["path"]] = {"language": module["language"], "symbols": module["symbols"]}
+        for spec in module["imports"]:
+            target, external = resolver.resolve(module, spec)
+            if target and target != module["path"]:
+                key = (module["path"], target)
+                graph.edges[key] = graph.edges.get(key, 0) + 1
+            elif external and not _is_standard_library(module["language"], external):
+                packages = graph.externals.setdefault(module["path"], {})
+                packages[external] = packages.get(external, 0) + 1
+    return graph
+
+
+def _is_standard_library(language, package):
+    if language == "python":
+        return package in getattr(sys, "stdlib_module_names", ())
+    if language == "go":
+        # Standard library import paths have no domain in their first element
+        return "." not in package.split("/")[0]
+    if language == "java":
+        return package.startswith(("java.", "javax."))
+    return package.startswith("node:") or package in node_builtins
+
+
+class _Resolver:
+    """
+    Maps raw import specs to repository files (or package directories, ending
+    in "/"), or to the name of an external package.
+    """
+
+    def __init__(self, root, modules):
+        self.root = root
+        self.python_modules = {}
+        self.java_classes = {}
+        self.java_packages = {}
+        python_names = []
+        for module in modules:
+            rel_path = module["path"]
+            if module["language"] == "python":
+                parts = rel_path[:-3].split("/")
+                # Register every suffix so that code under src/ or a subproject
+                # resolves too; a name matching a full path wins over suffixes
+                python_names.extend((i, ".".join(parts[i:]), rel_path) for i in range(len(parts)))
+            elif module["language"] == "java" and module["package"] is not None:
+                name = posixpath.splitext(posixpath.basename(rel_path))[0]
+                package = module["package"]
+                self.java_classes[f"{package}.{name}" if package else name] = rel_path
+                self.java_packages.setdefault(package, posixpath.dirname(rel_path) + "/")
+        for _, name, rel_path in sorted(python_names):
+            self.python_modules.setdefault(name, rel_path)
+        # Go module path -> directory of its go.mod, for every module in the tree
+        self.go_modules = {}
+        go_dirs = {posixpath.dirname(module["path"]) for module in modules if module["language"] == "go"}
+        seen = set()
+        for rel_dir in go_dirs:
+            while rel_dir not in seen:
+                seen.add(rel_dir)
+                try:
+                    with open(os.path.join(root, rel_dir, "go.mod"), "r", encoding="utf-8") as f:
+                        m = re.search(r"^module\s+(\S+)", f.read(), re.M)
+                    if m:
+                        self.go_modules[m.group(1)] = rel_dir
+                        break
+                except OSError:
+                    pass
+                rel_dir = posixpath.dirname(rel_dir)
+
+    def resolve(self, module, spec):
+        language = module["language"]
+        if language == "python":
+            return self._resolve_python(module["path"], *spec)
+        if language == "go":
+            for module_path, rel_dir in self.go_modules.items():
+                if spec == module_path or spec.startswith(module_path + "/"):
+                    return posixpath.join(rel_dir, spec[len(module_path):].strip("/")).strip("/") + "/", None
+            return None, spec
+        if language == "java":
+            name = spec[:-2] if spec.endswith(".*") else spec
+            while name:
+                if name in self.java_classes:
+                    return self.java_classes[name], None
+                if spec.endswith(".*") and name in self.java_packages:
+                    return self.java_packages[name], None
+                name = name.rpartition(".")[0]
+            return None, ".".join(spec.split(".")[:2])
+        return self._resolve_js(module["path"], spec)
+
+    def _resolve_python(self, rel_path, name, names, level):
+        if level:
+            base = posixpath.dirname(rel_path).split("/") if posixpath.dirname(rel_path) else []
+            base = base[:len(base) - (level - 1)] if level > 1 else base
+            prefix = "/".join(base)
+            candidates = [posixpath.join(prefix, *name.split(".")) if name else prefix]
+            for candidate in candidates:
+                for alias in names:
+                    target = self._python_path(posixpath.join(candidate, alias))
+                    if target:
+                        return target, None
+                target = self._python_path(candidate)
+                if target:
+                    return target, None
+            return None, None
+
+        for alias in names:
+            target = self.python_modules.get(f"{name}.{alias}")
+            if target:
+                return target, None
+        if name in self.python_modules:
+            return self.python_modules[name], None
+        # `import pkg` where pkg is a directory whose __init__.py is not scanned.
+        # A standard library name is never one, even if a local folder shares it.
+        if not _is_standard_library("python", name.split(".")[0]) and os.path.isdir(os.path.join(self.root, *name.split("."))):
+            return name.replace(".", "/") + "/", None
+        return None, name.split(".")[0]
+
+    def _python_path(self, rel_module):
+        rel_module = rel_module.strip("/")
+        if not rel_module:
+            return None
+        if os.path.isfile(os.path.join(self.root, rel_module + ".py")):
+            return rel_module + ".py"
+        if os.path.isdir(os.path.join(self.root, rel_module)):
+            return rel_module + "/"
+        return None
+
+    def _resolve_js(self, rel_path, spec):
+        if not spec.startswith("."):
+            parts = spec.split("/")
+            return None, "/".join(parts[:2]) if spec.startswith("@") else parts[0]
+        base = posixpath.normpath(posixpath.join(posixpath.dirname(rel_path), spec))
+        if base.startswith(".."):
+            return None, None
+        for suffix in js_resolve_suffixes:
+            candidate = base + suffix
+            if os.path.isfile(os.path.join(self.root, candidate)):
+                return candidate, None
+        if os.path.isdir(os.path.join(self.root, base)):
+            return base + "/", None
+        return None, None
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from tokens import count_tokens
+
+    start = time.perf_counter()
+    graph = build_graph(sys.argv[1] if len(sys.argv) > 1 else ".")
+    elapsed = time.perf_counter() - start
+    summary = graph.summary()
+    print(summary)
+    print()
+    print(graph.to_mermaid())
+    print()
+    print(f"[⏱️] {len(graph.modules)} modules, {len(graph.edges)} import edges in {elapsed:.2f}s; "
+          f"summary is {count_tokens(summary)} tokens")
@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import math
+import random
+import time
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic, offline stand-in for OpenAIEmbeddings. Every text maps to the
+    same unit vector on every run, and each call can be given a fixed latency plus
+    a per-text cost to mimic a remote backend. Calls fail with 429 or 5xx errors
+    at `error_rate`. Counts calls and embedded texts.
+    """
+
+    def __init__(self, size=256, latency=0.0, latency_per_text=0.0, model="fake-embedding",
+                 error_rate=0.0, error_codes=(429, 500, 503), seed=None):
+        self.size = size
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+        self.model = model
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.calls = 0
+        self.errors = 0
+        self.texts_embedded = 0
+        self._rng = random.Random(seed)
+
+    def _vector(self, text):
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vec = [rng.gauss(0, 1) for _ in range(self.size)]
+        norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+        return [x / norm for x in vec]
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.latency or self.latency_per_text:
+            time.sleep(self.latency + self.latency_per_text * len(texts))
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors += 1
+            raise FakeAPIError(self._rng.choice(self.error_codes))
+        self.texts_embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeAPIError(Exception):
+    """
+    Error raised by FakeChatModel, shaped like an OpenAI API status error.
+    """
+
+    def __init__(self, status_code, message=""):
+        super().__init__(message or f"fake API error {status_code}")
+        self.status_code = status_code
+
+
+class FakeChatModel(Runnable):
+    """
+    Offline chat model for load tests. It sleeps for a random latency between
+    `min_latency` and `max_latency` and fails with 429 or 5xx errors at
+    `error_rate`. It returns `respond(prompt_text)` as an AIMessage. By default
+    it echoes the last message, which for the inline-docs prompt is the code
+    itself.
+
+    `astream` yields the response in `chunk_size`-character pieces, one every
+    `chunk_latency` seconds, and at `truncate_rate` stops halfway with
+    finish_reason "length".
+    """
+
+    def __init__(self, min_latency=0.0, max_latency=0.0, error_rate=0.0,
+                 error_codes=(429, 500, 503), respond=None, seed=None, model_name="fake-chat",
+                 chunk_size=4, chunk_latency=0.0, truncate_rate=0.0):
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.respond = respond
+        self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.truncate_rate = truncate_rate
+        self.calls = 0
+        self.errors = 0
+        self.truncations = 0
+        self._rng = random.Random(seed)
+
+    def _prepare(self, input):
+        self.calls += 1
+        if isinstance(input, PromptValue):
+            messages = input.to_messages()
+            text = messages[-1].content if messages else ""
+        elif isinstance(input, str):
+            text = input
+        else:
+            text = input[-1].content if input else ""
+        latency = self._rng.uniform(self.min_latency, self.max_latency)
+        fail = self._rng.random() < self.error_rate
+        return text, latency, fail
+
+    def _finish(self, text, fail):
+        if fail:
+            self.errors += 1
+            raise FakeAPIError(self._rng.choice(self.error_codes))
+        content = self.respond(text) if self.respond else text
+        return AIMessage(content=content, response_metadata={"finish_reason": "stop"})
+
+    def invoke(self, input, config=None, **kwargs):
+        text, latency, fail = self._prepare(input)
+        time.sleep(latency)
+        return self._finish(text, fail)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        text, latency, fail = self._prepare(input)
+        await asyncio.sleep(latency)
+        return self._finish(text, fail)
+
+    async def astream(self, input, config=None, **kwargs):
+        text, latency, fail = self._prepare(input)
+        await asyncio.sleep(latency)
+        content = self._finish(text, fail).content
+        finish_reason = "stop"
+        if self._rng.random() < self.truncate_rate:
+            self.truncations += 1
+            content, finish_reason = content[:len(content) // 2], "length"
+        for start in range(0, len(content), self.chunk_size):
+            if start:
+                await asyncio.sleep(self.chunk_latency)
+            yield AIMessageChunk(content=content[start:start + self.chunk_size])
+        yield AIMessageChunk(content="", response_metadata={"finish_reason": finish_reason})
@@ -1,8 +1,16 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-import pathspec
+import asyncio
+import logging
 import os
 import subprocess
 
+from gitignore import GitIgnoreMatcher
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
 
 programming_extensions = [
     ".py",
@@ -48,51 +56,238 @@ def detect_repo():
         return False
 
 
-def scan_subfolders(path):
+scan_extensions = {
+    ".py", ".js", ".ts", ".java", ".cs", ".cpp", ".c", ".go", ".rb",
+    ".php", ".rs", ".kt", ".swift", ".scala", ".sh", ".pl", ".dart",
+    ".html",".json", ".xml", ".yml", ".yaml", ".sql", ".jsx",
+    ".tsx", ".vue", ".svelte",".properties"
+}
+
+skip_filenames = {
+    "package.json", "package-lock.json", "yarn.lock", "requirements.txt",
+    "Pipfile", "Pipfile.lock", "poetry.lock", "go.mod", "go.sum",
+    "build.gradle", "settings.gradle", "pom.xml",
+    ".env", "Makefile", "Dockerfile", "Cargo.toml", "Cargo.lock",
+    "tsconfig.json", "vite.config.js", "babel.config.js",
+    "next.config.js", "jest.config.js", "webpack.config.js",
+    "manifest.json", "index.html", "index.css", "index.js", "index.ts",
+    "__init__.py","nodemon.json"
+}
+
+
+class FilePolicy:
+    """
+    Thresholds for the cheap pre-filter run during the scan, and what to do with
+    each kind of flagged file: "drop" it, "tag" it (keep it but record it in the
+    report) or "keep" it.
+    """
+
+    def __init__(self, max_bytes=512_000, sniff_bytes=8192, max_line_length=1000,
+                 min_whitespace_ratio=0.05, actions=None):
+        self.max_bytes = max_bytes
+        self.sniff_bytes = sniff_bytes
+        self.max_line_length = max_line_length
+        self.min_whitespace_ratio = min_whitespace_ratio
+        self.actions = {
+            "oversized": "drop",
+            "binary": "drop",
+            "minified": "drop",
+            "generated": "drop",
+        }
+        self.actions.update(actions or {})
+
+
+class ScanReport:
+    """
+    What the pre-filter flagged in one repository. Skipped chunks are estimated
+    for the `chunking.chunk_code` budget of `max_tokens` that indexing uses, at
+    about 4 bytes per token.
+    """
+
+    def __init__(self, max_tokens=512):
+        self.max_tokens = max_tokens
+        self.kept_files = 0
+        self.skipped = {}  # kind -> [files, bytes, chunks]
+        self.tagged = {}  # path -> kind
+
+    def record(self, file_path, kind, size, action):
+        if action == "tag":
+            self.tagged[file_path] = kind
+            return
+        stats = self.skipped.setdefault(kind, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += size
+        # Every non-empty file is at least one chunk
+        stats[2] += -(-size // (self.max_tokens * 4))
+
+    def skipped_bytes(self):
+        return sum(size for _, size, _ in self.skipped.values())
+
+    def skipped_chunks(self):
+        return sum(chunks for _, _, chunks in self.skipped.values())
+
+    def summary(self):
+        files = sum(count for count, _, _ in self.skipped.values())
+        kinds = ", ".join(f"{kind}: {count}" for kind, (count, _, _) in sorted(self.skipped.items()))
+        return (
+            f"[🧹] Kept {self.kept_files} files, skipped {files} "
+            f"({self.skipped_bytes()} bytes, ~{self.skipped_chunks()} chunks)"
+            + (f" [{kinds}]" if kinds else "")
+            + (f", tagged {len(self.tagged)}" if self.tagged else "")
+        )
+
+
+default_file_policy = FilePolicy()
+
+generated_name_suffixes = (
+    ".min.js", ".min.css", ".bundle.js", ".chunk.js", "-lock.json", ".lock.json",
+    ".pb.go", "_pb2.py", "_pb2_grpc.py", ".g.dart", ".freezed.dart", ".designer.cs",
+)
+
+generated_markers = (b"@generated", b"do not edit", b"auto-generated", b"autogenerated")
+
+
+def classify_file(file_path, size, policy=default_file_policy):
+    """
+    Flags files that are not worth reading and embedding, using only their size
+    and the first `policy.sniff_bytes` bytes. Returns "oversized", "binary",
+    "generated", "minified", or None for a regular source file.
+    """
+    if size > policy.max_bytes:
+        return "oversized"
+    if file_path.endswith(generated_name_suffixes):
+        return "generated"
+
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(policy.sniff_bytes)
+    except OSError:
+        return None
+    if not head:
+        return None
+
+    if b"\0" in head:
+        return "binary"
+    if any(marker in head[:1024].lower() for marker in generated_markers):
+        return "generated"
+
+    lines = head.split(b"\n")
+    # The last line may be cut by the sniff window, so only count it if the file is that short
+    complete_lines = lines if len(head) == size else lines[:-1] or lines
+    if max(len(line) for line in complete_lines) > policy.max_line_length:
+        return "minified"
+    if len(head) >= 512:
+        whitespace = sum(head.count(c) for c in (b" ", b"\t", b"\n", b"\r"))
+        if whitespace / len(head) < policy.min_whitespace_ratio:
+            return "minified"
+    return None
+
+
+def scan_subfolders(path, policy=default_file_policy, report=None):
     """
     Scans all subfolders for source code files and returns their paths,
     skipping files and directories ignored by .gitignore and known non-code files.
+    Binary, minified, generated and oversized files are handled by `policy`
+    (pass None to disable the pre-filter) and summarised in `report`.
     """
-    programming_extensions = {
-        ".py", ".js", ".ts", ".java", ".cs", ".cpp", ".c", ".go", ".rb",
-        ".php", ".rs", ".kt", ".swift", ".scala", ".sh", ".pl", ".dart",
-        ".html",".json", ".xml", ".yml", ".yaml", ".sql", ".jsx",
-        ".tsx", ".vue", ".svelte",".properties"
-    }
-
-    skip_filenames = {
-        "package.json", "package-lock.json", "yarn.lock", "requirements.txt",
-        "Pipfile", "Pipfile.lock", "poetry.lock", "go.mod", "go.sum",
-        "build.gradle", "settings.gradle", "pom.xml",
-        ".env", "Makefile", "Dockerfile", "Cargo.toml", "Cargo.lock",
-        "tsconfig.json", "vite.config.js", "babel.config.js",
-        "next.config.js", "jest.config.js", "webpack.config.js",
-        "manifest.json", "index.html", "index.css", "index.js", "index.ts",
-        "__init__.py","nodemon.json"
-    }
-
-    ignored_paths = set(get_gitignored_contents(path)) if path else set()
-    ignored_paths = {str(Path(p).resolve()) for p in ignored_paths}  # Normalize
+    report = report if report is not None else ScanReport()
     res_files = []
+    with metrics.span("scan", repo=path):
+        for file_path in walk_source_files(path, policy=policy, report=report):
+            res_files.append(file_path)
+            logger.debug("%s", file_path)
+    metrics.count("files_scanned_total", len(res_files), repo=path)
+    logger.info(report.summary())
+    return res_files
+
+
+def walk_source_files(path, matcher=None, policy=None, report=None):
+    """
+    Walks the tree under `path` once with os.scandir and yields the absolute path
+    of every source file. .gitignore rules are checked on the way down, so ignored
+    directories (node_modules, venv, build output...) are never entered.
+    If a `policy` is given, each candidate is classified with `classify_file`
+    before it is yielded and the outcome is recorded in `report`.
+    """
+    matcher = matcher or GitIgnoreMatcher(path)
+    # Each pending directory carries the .gitignore specs of its ancestors
+    pending = [(matcher.root, "", ())]
 
-    for root, dirs, files in os.walk(path, topdown=True):
-        root_path = Path(root).resolve()
+    while pending:
+        dir_path, rel_dir, parent_stack = pending.pop()
+        stack = matcher.stack_for(rel_dir, parent_stack)
 
-        # Skip ignored directories before descending into them
-        dirs[:] = [d for d in dirs if str((root_path / d).resolve()) not in ignored_paths]
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            continue
 
-        for file in files:
-            file_path = (root_path / file).resolve()
-            ext = file_path.suffix
+        subdirs = []
+        for entry in entries:
+            rel_path = rel_dir + entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
 
-            if str(file_path) in ignored_paths:
+            if is_dir:
+                # Like os.walk, symlinked directories are not followed
+                if entry.name == ".git" or entry.is_symlink():
+                    continue
+                if not matcher.match(rel_path, True, stack):
+                    subdirs.append((entry.path, rel_path + "/", stack))
                 continue
-            if ext in programming_extensions and file not in skip_filenames:
-                res_files.append(str(file_path))
-                print(str(file_path))
 
-    return res_files
+            if entry.name in skip_filenames:
+                continue
+            if os.path.splitext(entry.name)[1] not in scan_extensions:
+                continue
+            if matcher.match(rel_path, False, stack):
+                continue
+            if policy is not None:
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    continue
+                kind = classify_file(entry.path, size, policy)
+                action = policy.actions.get(kind, "keep") if kind else "keep"
+                if kind and action != "keep" and report is not None:
+                    report.record(entry.path, kind, size, action)
+                if action == "drop":
+                    continue
+            if report is not None:
+                report.kept_files += 1
+            yield entry.path
 
+        # Reversed so directories are visited in scandir order, as with os.walk
+        pending.extend(reversed(subdirs))
+
+
+def is_source_file(file_path, matcher, policy=default_file_policy):
+    """
+    True if `walk_source_files` would yield `file_path`: the same extension,
+    `skip_filenames`, .gitignore (including ignored parent directories) and
+    `policy` rules, checked for one path under `matcher.root`, e.g. a path
+    reported by a file watcher.
+    """
+    name = os.path.basename(file_path)
+    if name in skip_filenames or os.path.splitext(name)[1] not in scan_extensions:
+        return False
+    rel_path = os.path.relpath(file_path, matcher.root).replace(os.sep, "/")
+    if rel_path.startswith("../") or ".git" in rel_path.split("/")[:-1]:
+        return False
+    if matcher.is_ignored(rel_path):
+        return False
+    try:
+        size = os.stat(file_path).st_size
+    except OSError:
+        return False
+    if policy is not None:
+        kind = classify_file(file_path, size, policy)
+        if kind and policy.actions.get(kind, "keep") == "drop":
+            return False
+    return True
 
 
 def get_gitignored_contents(base_path="."):
@@ -100,63 +295,127 @@ def get_gitignored_contents(base_path="."):
     Recursively collects ignored file/folder paths across all `.gitignore` files
     in the project directory, including contents of ignored folders.
     """
-    base_path = Path(base_path).resolve()
+    with metrics.span("gitignore", repo=base_path):
+        return _collect_ignored(GitIgnoreMatcher(base_path))
+
+
+def _collect_ignored(matcher):
     ignored = set()
-    cumulative_spec = pathspec.PathSpec([])
+    pending = [(matcher.root, "", ())]
 
-    for root, dirs, files in os.walk(base_path, topdown=True):
-        current_path = Path(root)
-        gitignore_file = current_path / ".gitignore"
+    while pending:
+        dir_path, rel_dir, parent_stack = pending.pop()
+        stack = matcher.stack_for(rel_dir, parent_stack)
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            continue
 
-        # Parse .gitignore in current folder
-        if gitignore_file.exists():
-            try:
-                lines = gitignore_file.read_text().splitlines()
-                patterns = [line for line in lines if line.strip() and not line.strip().startswith("#")]
-                spec = pathspec.PathSpec.from_lines("gitwildmatch", patterns)
-                cumulative_spec = cumulative_spec + spec
-            except Exception as e:
-                print(f"⚠️ Could not parse {gitignore_file}: {e}")
-
-        # Skip ignored directories and collect full subtree
-        for d in list(dirs):
-            rel_path = (current_path / d).relative_to(base_path)
-            abs_path = (current_path / d).resolve()
-            if cumulative_spec.match_file(str(rel_path)):
-                for sub_root, sub_dirs, sub_files in os.walk(abs_path):
-                    for f in sub_files:
-                        ignored.add(str(Path(sub_root) / f))
-                    for sd in sub_dirs:
-                        ignored.add(str(Path(sub_root) / sd))
-                ignored.add(str(abs_path))  # Include the folder itself
-                dirs.remove(d)
-
-        # Check ignored files
-        for f in files:
-            rel_path = (current_path / f).relative_to(base_path)
-            abs_path = (current_path / f).resolve()
-            if cumulative_spec.match_file(str(rel_path)):
-                ignored.add(str(abs_path))
+        for entry in entries:
+            rel_path = rel_dir + entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if not matcher.match(rel_path, is_dir, stack):
+                if is_dir:
+                    pending.append((entry.path, rel_path + "/", stack))
+                continue
+
+            ignored.add(entry.path)
+            if is_dir:
+                # Include the full subtree of an ignored folder
+                for sub_root, sub_dirs, sub_files in os.walk(entry.path):
+                    for f in sub_files + sub_dirs:
+                        ignored.add(os.path.join(sub_root, f))
 
     return ignored
 
 def read_contents(files_to_read):
-    res = []
-    for file in files_to_read:
-        try:
-            extension = os.path.splitext(file)[1].lstrip(".")
-            with open(file, "r", encoding="utf-8") as f:
-                res.append({
-                    "filePath": file,
-                    "extension": extension,
-                    "contents":f.read()
-                })
-        except Exception as e:
-            print(f"Could not read {file}: {e}")
-            return []
-    return res
+    """
+    Reads every file into a list of {"filePath", "extension", "contents"} records,
+    in input order. Files that cannot be read or decoded are skipped.
+    """
+    with metrics.span("read"):
+        return list(iter_contents(files_to_read, ordered=True))
+
+
+def read_file(file):
+    extension = os.path.splitext(file)[1].lstrip(".")
+    with open(file, "r", encoding="utf-8") as f:
+        record = {
+            "filePath": file,
+            "extension": extension,
+            "contents": f.read()
+        }
+        metrics.count("files_read_total")
+        metrics.count("bytes_read_total", os.fstat(f.fileno()).st_size)
+        return record
+
+
+def iter_contents(files_to_read, max_workers=8, max_in_flight=32, ordered=False, on_error=None):
+    """
+    Reads files on a bounded thread pool and yields their records as soon as they
+    are read, so chunking and LLM work can start while I/O is still going.
+
+    At most `max_in_flight` files are being read or waiting to be consumed at any
+    time, which bounds memory regardless of repository size. With `ordered=True`
+    records come back in input order, otherwise in completion order. A file that
+    cannot be read or decoded is reported (through `on_error(file, exc)` if given)
+    and skipped on its own.
+    """
+    files_iter = iter(files_to_read)
+    in_flight = deque()
+
+    def submit_next(executor):
+        for file in files_iter:
+            in_flight.append((file, executor.submit(read_file, file)))
+            return True
+        return False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in range(max_in_flight):
+            if not submit_next(executor):
+                break
+
+        while in_flight:
+            if ordered:
+                file, future = in_flight.popleft()
+            else:
+                wait([f for _, f in in_flight], return_when=FIRST_COMPLETED)
+                idx = next(i for i, (_, f) in enumerate(in_flight) if f.done())
+                file, future = in_flight[idx]
+                del in_flight[idx]
+            submit_next(executor)
+
+            try:
+                record = future.result()
+            except Exception as e:
+                logger.warning("Could not read %s: %s", file, e)
+                metrics.count("read_errors_total")
+                if on_error is not None:
+                    on_error(file, e)
+                continue
+            yield record
+
+
+async def aiter_contents(files_to_read, **kwargs):
+    """
+    Async iterator over `iter_contents`, for consumers running on an event loop.
+    """
+    records = iter_contents(files_to_read, **kwargs)
+    done = object()
+    try:
+        while True:
+            record = await asyncio.to_thread(next, records, done)
+            if record is done:
+                break
+            yield record
+    finally:
+        records.close()
 
 if __name__ == "__main__":
+    from metrics import configure_logging
+
+    configure_logging()
     curr_path = "/Users/demonicaoi/Documents/MERN-Stack"
     resultant_files = scan_subfolders(curr_path)
     read_files = read_contents(resultant_files)
@@ -0,0 +1,315 @@
+import logging
+import os
+import re
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class GitIgnoreSpec:
+    """
+    The patterns of a single .gitignore file, scoped to the directory it lives in.
+
+    Every pattern is translated to a regex once, and all of them are combined into a
+    single alternation (last pattern first), so one `fullmatch` call answers both
+    "does anything match?" and "which pattern matched last?".
+    """
+
+    def __init__(self, lines, base=""):
+        # `base` is the directory of the .gitignore relative to the root, e.g. "src/app/"
+        self.base = base
+        self.patterns = []
+        self.negated = []
+        file_parts, dir_parts = [], []
+
+        for line in lines:
+            parsed = _parse_line(line)
+            if parsed is None:
+                continue
+            regex, negated, dir_only = parsed
+            idx = len(self.patterns)
+            self.patterns.append(line)
+            self.negated.append(negated)
+            group = f"(?P<p{idx}>{regex})"
+            dir_parts.append(group)
+            if not dir_only:
+                file_parts.append(group)
+
+        # Reversed so the first alternative that matches is the last pattern in the file
+        self._file_regex = _combine(file_parts)
+        self._dir_regex = _combine(dir_parts)
+
+    @classmethod
+    def from_file(cls, gitignore_file, base=""):
+        with open(gitignore_file, "r", encoding="utf-8", errors="replace") as f:
+            return cls(f.read().splitlines(), base)
+
+    def match(self, rel_path, is_dir=False):
+        """
+        Returns True if `rel_path` (relative to the root) is ignored by this file,
+        False if a negated pattern re-includes it, and None if no pattern applies.
+        """
+        regex = self._dir_regex if is_dir else self._file_regex
+        if regex is None:
+            return None
+        if self.base:
+            if not rel_path.startswith(self.base):
+                return None
+            rel_path = rel_path[len(self.base):]
+        m = regex.fullmatch(rel_path)
+        if m is None:
+            return None
+        return not self.negated[int(m.lastgroup[1:])]
+
+
+class GitIgnoreMatcher:
+    """
+    Answers gitignore questions for a tree rooted at `root`, following git's rules:
+    each .gitignore only applies below its own directory, deeper files take
+    precedence over shallower ones, and nothing inside an ignored directory can be
+    re-included. Parsed specs and directory decisions are cached.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self._specs = {}
+        self._stacks = {}
+        self._dir_cache = {}
+
+    def spec_for(self, rel_dir):
+        """
+        Returns the parsed .gitignore of `rel_dir` ("" or "a/b/"), or None.
+        """
+        if rel_dir not in self._specs:
+            gitignore_file = os.path.join(self.root, rel_dir, ".gitignore")
+            try:
+                self._specs[rel_dir] = GitIgnoreSpec.from_file(gitignore_file, rel_dir)
+            except FileNotFoundError:
+                self._specs[rel_dir] = None
+            except OSError as e:
+                logger.warning("⚠️ Could not parse %s: %s", gitignore_file, e)
+                self._specs[rel_dir] = None
+        return self._specs[rel_dir]
+
+    def stack_for(self, rel_dir, parent_stack=None):
+        """
+        Returns the specs that apply inside `rel_dir`, from the root downwards.
+        Walkers pass the parent's stack so it does not need to be rebuilt.
+        """
+        stack = self._stacks.get(rel_dir)
+        if stack is not None:
+            return stack
+        if parent_stack is None:
+            parent_stack = self.stack_for(_parent_dir(rel_dir)) if rel_dir else ()
+        spec = self.spec_for(rel_dir)
+        stack = parent_stack + (spec,) if spec is not None and spec.patterns else parent_stack
+        self._stacks[rel_dir] = stack
+        return stack
+
+    def match(self, rel_path, is_dir=False, stack=None):
+        """
+        Checks `rel_path` against the specs of its directory only, assuming its
+        parent directories are already known not to be ignored (as in a walk).
+        """
+        if stack is None:
+            stack = self.stack_for(_parent_dir(rel_path))
+        for spec in reversed(stack):
+            decision = spec.match(rel_path, is_dir)
+            if decision is not None:
+                return decision
+        return False
+
+    def is_ignored(self, rel_path, is_dir=False):
+        """
+        Checks `rel_path` (relative to the root, "/"-separated) including its parent
+        directories, the way `git check-ignore` would.
+        """
+        rel_path = rel_path.strip("/")
+        parent = _parent_dir(rel_path)
+        if parent and self._is_dir_ignored(parent):
+            return True
+        return self.match(rel_path, is_dir)
+
+    def _is_dir_ignored(self, rel_dir):
+        # rel_dir carries a trailing slash, e.g. "a/b/"
+        cached = self._dir_cache.get(rel_dir)
+        if cached is not None:
+            return cached
+        parent = _parent_dir(rel_dir[:-1])
+        ignored = (bool(parent) and self._is_dir_ignored(parent)) or self.match(rel_dir[:-1], True)
+        self._dir_cache[rel_dir] = ignored
+        return ignored
+
+
+def _parent_dir(rel_path):
+    """
+    "a/b/c" -> "a/b/", "a" -> "", "a/b/" -> "a/"
+    """
+    idx = rel_path.rstrip("/").rfind("/")
+    return rel_path[:idx + 1] if idx >= 0 else ""
+
+
+def _combine(parts):
+    if not parts:
+        return None
+    return re.compile("|".join(reversed(parts)), re.DOTALL)
+
+
+def _parse_line(line):
+    """
+    Translates one .gitignore line into (regex, negated, dir_only), or None for
+    blank lines and comments.
+    """
+    if not line or line.startswith("#"):
+        return None
+
+    # Trailing spaces are ignored unless escaped with a backslash
+    stripped = line.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(line):
+        stripped += " "
+    line = stripped
+    if not line:
+        return None
+
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+
+    # A slash at the start or in the middle anchors the pattern to the .gitignore directory
+    anchored = "/" in line
+    line = line.lstrip("/")
+
+    regex = _translate(line)
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return regex, negated, dir_only
+
+
+def _translate(pattern):
+    """
+    Translates a gitignore glob (without leading/trailing slashes) into a regex.
+    """
+    segments = pattern.split("/")
+    if segments == ["**"]:
+        return ".*"
+
+    res = ""
+    need_sep = False
+    for i, segment in enumerate(segments):
+        if segment == "**":
+            if i == 0:
+                res += "(?:.*/)?"
+                need_sep = False
+            elif i == len(segments) - 1:
+                res += "/.*"
+            else:
+                # "a/**/b" matches zero or more directories between a and b
+                res += "(?:/.*)?"
+                need_sep = True
+            continue
+        if need_sep:
+            res += "/"
+        res += _translate_segment(segment)
+        need_sep = True
+    return res
+
+
+def _translate_segment(segment):
+    res = []
+    i, n = 0, len(segment)
+    while i < n:
+        c = segment[i]
+        if c == "*":
+            while i + 1 < n and segment[i + 1] == "*":
+                i += 1
+            res.append("[^/]*")
+        elif c == "?":
+            res.append("[^/]")
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            res.append(re.escape(segment[i]))
+        elif c == "[":
+            end, char_class = _translate_class(segment, i)
+            if char_class is None:
+                res.append(re.escape(c))
+            else:
+                res.append(char_class)
+                i = end
+        else:
+            res.append(re.escape(c))
+        i += 1
+    return "".join(res)
+
+
+def _translate_class(segment, start):
+    """
+    Translates a bracket expression starting at `start`. Returns the index of the
+    closing bracket and the regex class, or (start, None) if it is not closed.
+    """
+    i = start + 1
+    negated = i < len(segment) and segment[i] in "!^"
+    if negated:
+        i += 1
+    body = []
+    first = True
+    while i < len(segment):
+        c = segment[i]
+        if c == "]" and not first:
+            prefix = "[^/" if negated else "["
+            return i, prefix + "".join(body) + "]"
+        if c == "\\" and i + 1 < len(segment):
+            i += 1
+            body.append(re.escape(segment[i]))
+        elif c in "[]^\\":
+            body.append("\\" + c)
+        else:
+            body.append(c)
+        first = False
+        i += 1
+    return start, None
+
+
+def benchmark_matching(counts=(1, 10, 100, 1000), depth=8, paths_per_run=20000):
+    """
+    Measures the cost of matching one path as the number of .gitignore files in
+    the tree grows. The files form chains `depth` directories deep
+    (pkg0/d0/, pkg0/d0/d1/, ...), so paths at the bottom of a chain are matched
+    against a stack of `depth` + 1 specs. Returns {.gitignore count: microseconds
+    per path}.
+    """
+    results = {}
+    for count in counts:
+        with tempfile.TemporaryDirectory() as root:
+            rel_dirs = [""]
+            for idx in range(count - 1):
+                chain, level = divmod(idx, depth)
+                rel_dirs.append(f"pkg{chain}/" + "".join(f"d{i}/" for i in range(level + 1)))
+            for idx, rel_dir in enumerate(rel_dirs):
+                os.makedirs(os.path.join(root, rel_dir), exist_ok=True)
+                with open(os.path.join(root, rel_dir, ".gitignore"), "w") as f:
+                    f.write(f"*.tmp{idx}\nbuild{idx}/\n!keep{idx}.py\n/anchored{idx}\n")
+
+            matcher = GitIgnoreMatcher(root)
+            stacks = [(rel_dir, matcher.stack_for(rel_dir)) for rel_dir in rel_dirs]
+            paths = [
+                (f"{stacks[i % len(stacks)][0]}file{i}.py", stacks[i % len(stacks)][1])
+                for i in range(paths_per_run)
+            ]
+            start = time.perf_counter()
+            for path, stack in paths:
+                matcher.match(path, False, stack)
+            elapsed = time.perf_counter() - start
+            results[count] = elapsed / paths_per_run * 1e6
+    return results
+
+
+if __name__ == "__main__":
+    # The conformance corpus runs under pytest: test_gitignore.py
+    for count, micros in benchmark_matching().items():
+        print(f"[⏱️] {count:>5} .gitignore files: {micros:.2f} µs per path")
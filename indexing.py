@@ -0,0 +1,337 @@
+import hashlib
+import json
+import logging
+import os
+from array import array
+
+from chunk_store import ChunkStore
+from dedupe import ChunkDeduplicator
+from files import scan_subfolders
+from journal import atomic_open
+from metrics import metrics
+from rag_test import document_id, add_documents_in_batches
+
+logger = logging.getLogger(__name__)
+
+persist_directory = "./vector_db"
+manifest_directory = "./vector_db_manifests"
+# "chroma" (persistent database) or "numpy" (in-memory matrix saved as .npy files)
+vector_store_backend = os.getenv("VECTOR_STORE", "chroma")
+
+
+def collection_name_for(path):
+    """
+    One collection per repository, named after the repository folder and a hash
+    of its absolute path (Chroma names allow [a-zA-Z0-9._-], 3-63 characters).
+    """
+    real_path = os.path.realpath(path)
+    name = "".join(c if c.isalnum() or c in "._-" else "_" for c in os.path.basename(real_path))
+    digest = hashlib.sha1(real_path.encode("utf-8")).hexdigest()[:12]
+    return f"{name[:40] or 'repo'}_{digest}"
+
+
+def open_vector_store(path, embeddings, backend=None):
+    """
+    Opens the vector store of the repository at `path`: its persistent Chroma
+    collection, or with the "numpy" backend its NumpyVectorStore saved under
+    `persist_directory`.
+    """
+    if (backend or vector_store_backend) == "numpy":
+        from numpy_store import NumpyVectorStore
+
+        return NumpyVectorStore.load(os.path.join(persist_directory, "numpy", collection_name_for(path)), embeddings)
+
+    from langchain_chroma import Chroma
+
+    return Chroma(
+        collection_name=collection_name_for(path),
+        embedding_function=embeddings,
+        persist_directory=persist_directory,
+    )
+
+
+class IndexManifest:
+    """
+    Persistent record of what is already embedded for one collection: for every
+    file its mtime, size and content hash, and the vector store IDs of its chunks.
+    """
+
+    def __init__(self, collection_name, directory=manifest_directory):
+        self.manifest_path = os.path.join(directory, f"{collection_name}.json")
+        self.files = {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.files = json.load(f)["files"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            logger.warning("⚠️ Ignoring unreadable manifest %s: %s", self.manifest_path, e)
+
+    def save(self):
+        # Each writer gets its own temporary file, so concurrent saves of one
+        # collection (pool workers, the watcher) never publish a torn manifest
+        with atomic_open(self.manifest_path) as f:
+            json.dump({"files": self.files}, f)
+
+
+def open_manifest(vector_store, path):
+    """
+    Loads the manifest that belongs to `vector_store`. Each backend keeps its own,
+    as they hold different copies of the vectors.
+    """
+    in_memory = getattr(vector_store, "save", None) is not None
+    manifest = IndexManifest(collection_name_for(path) + ("_numpy" if in_memory else ""))
+    if not os.path.isdir(persist_directory) or (in_memory and not len(vector_store)):
+        # The vector store was wiped, so nothing recorded in the manifest exists any more
+        manifest.files = {}
+    return manifest
+
+
+def index_repository(vector_store, path, manifest=None, batch_size=256, dedupe=True, files=None):
+    """
+    Brings the vector store of the repository at `path` up to date. Only new or
+    changed files are read, chunked and embedded; vectors of changed and removed
+    files are deleted. Files whose mtime and size are unchanged are not even read,
+    and files whose content hash is unchanged are not re-embedded.
+
+    With `dedupe`, duplicate chunks among the files being embedded are not stored.
+    Instead they are listed as aliases of the chunk that is kept. A file whose
+    chunks were dropped as duplicates is re-indexed when a file it duplicated
+    changes or disappears.
+
+    `files` is the result of `scan_subfolders(path)` when it is already known.
+
+    Returns {"added", "changed", "removed", "unchanged", "chunks", "duplicates"}
+    counts and the repository "fingerprint".
+    """
+    if manifest is None:
+        manifest = open_manifest(vector_store, path)
+    stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0, "chunks": 0, "duplicates": 0}
+    deduplicator = ChunkDeduplicator(key=document_id) if dedupe else None
+    documents = iter_changes(path, manifest, stats, lambda ids: _delete_ids(vector_store, ids), deduplicator, files)
+    stats["chunks"] = add_documents_in_batches(vector_store, documents, batch_size, on_added=record_ids(manifest))
+    return finish_index(vector_store, path, manifest, stats, deduplicator, batch_size)
+
+
+def plan_index(path, manifest, dedupe=True, files=None):
+    """
+    The CPU and disk part of `index_repository`: scans, chunks and dedupes the
+    new and changed files without touching the vector store. Only plain data
+    goes in and out, so it can run in a worker process.
+
+    Returns {"manifest", "stats", "deleted", "chunks", "rows", "deduplicator"}.
+    "chunks" is the ChunkStore of the changed files and "rows" the rows of it
+    that survived dedupe; their text is only read when `chunks.documents(rows)`
+    materializes a batch. The vector store IDs in "deleted" must be deleted
+    before the documents are added, and then the index is completed with
+    `finish_index`.
+    """
+    stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0, "chunks": 0, "duplicates": 0}
+    deduplicator = ChunkDeduplicator(key=document_id) if dedupe else None
+    deleted = []
+    chunks = collect_changes(path, manifest, stats, deleted.extend, files)
+    if deduplicator is not None:
+        rows = array("I", (doc.metadata["id"] for doc in deduplicator.filter(chunks.iter_documents())))
+    else:
+        rows = array("I", range(len(chunks)))
+    chunks.close()
+    return {"manifest": manifest, "stats": stats, "deleted": deleted,
+            "chunks": chunks, "rows": rows, "deduplicator": deduplicator}
+
+
+def iter_changes(path, manifest, stats, on_delete, deduplicator=None, files=None):
+    """
+    Yields the (deduplicated) Documents of new and changed files, after the
+    manifest entries and `stats` are updated and every vector store ID that is
+    no longer valid is passed to `on_delete`.
+    """
+    documents = collect_changes(path, manifest, stats, on_delete, files).iter_documents()
+    if deduplicator is not None:
+        documents = deduplicator.filter(documents)
+    yield from documents
+
+
+def collect_changes(path, manifest, stats, on_delete, files=None, max_tokens=512):
+    """
+    Chunks the new and changed files into a ChunkStore, and updates the
+    manifest entries and `stats`. Vector store IDs that are no longer valid are
+    passed to `on_delete`.
+    """
+    current_files = scan_subfolders(path) if files is None else files
+    current = set(current_files)
+
+    candidates = {}
+    for file in current_files:
+        try:
+            st = os.stat(file)
+        except OSError:
+            continue
+        entry = manifest.files.get(file)
+        if entry and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            stats["unchanged"] += 1
+            continue
+        candidates[file] = st
+
+    removed = [file for file in manifest.files if file not in current]
+
+    # Files holding duplicates of a touched file lose their only stored copy,
+    # so they are re-indexed as well
+    touched = set(candidates) | set(removed)
+    forced = set()
+    for file, entry in manifest.files.items():
+        if file in current and file not in candidates and touched.intersection(entry.get("duplicate_of", ())):
+            try:
+                candidates[file] = os.stat(file)
+            except OSError:
+                continue
+            forced.add(file)
+            stats["unchanged"] -= 1
+
+    def accept(file, contents):
+        st = candidates[file]
+        metrics.count("files_read_total")
+        metrics.count("bytes_read_total", st.st_size)
+        digest = hashlib.sha256(contents.encode("utf-8")).hexdigest()
+        entry = manifest.files.get(file)
+        if entry and entry["hash"] == digest and file not in forced:
+            entry["mtime"], entry["size"] = st.st_mtime_ns, st.st_size
+            stats["unchanged"] += 1
+            return False
+        if entry:
+            on_delete(entry["ids"])
+            stats["changed"] += 1
+        else:
+            stats["added"] += 1
+        manifest.files[file] = {
+            "mtime": st.st_mtime_ns, "size": st.st_size, "hash": digest, "ids": [],
+        }
+        return True
+
+    chunks = ChunkStore()
+    for file in candidates:
+        try:
+            added = chunks.add_file(file, max_tokens, accept)
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning("Could not read %s: %s", file, e)
+            metrics.count("read_errors_total")
+            # A file that can no longer be read is treated as removed
+            if file in manifest.files:
+                removed.append(file)
+            continue
+        metrics.count("chunks_total", added, splitter="code")
+
+    for file in removed:
+        on_delete(manifest.files.pop(file)["ids"])
+        stats["removed"] += 1
+    return chunks
+
+
+def record_ids(manifest):
+    """
+    `on_added` callback that records the IDs of each added batch in the manifest.
+    """
+    def on_added(batch, ids):
+        for doc, doc_id in zip(batch, ids):
+            manifest.files[doc.metadata["source"]]["ids"].append(doc_id)
+    return on_added
+
+
+def finish_index(vector_store, path, manifest, stats, deduplicator=None, batch_size=256):
+    """
+    Drops aliases whose files were removed or changed, stores the new
+    duplicate aliases, saves the vector store (if in memory) and the manifest,
+    and returns `stats` with the repository "fingerprint".
+    """
+    _prune_aliases(vector_store, manifest, batch_size)
+    if deduplicator is not None:
+        _store_aliases(vector_store, deduplicator, batch_size)
+        for file, sources in deduplicator.duplicate_sources.items():
+            if file in manifest.files:
+                manifest.files[file]["duplicate_of"] = sorted(sources)
+        # The kept file remembers the hash of each alias file, so a later run
+        # can tell when an alias no longer holds
+        for key, (source, files) in deduplicator.alias_sources.items():
+            if source in manifest.files:
+                manifest.files[source].setdefault("aliased_by", {})[key] = {
+                    file: manifest.files[file]["hash"] for file in sorted(files) if file in manifest.files
+                }
+        stats["duplicates"] = deduplicator.stats["exact"] + deduplicator.stats["near"]
+        logger.info(deduplicator.summary())
+
+    if getattr(vector_store, "save", None) is not None:
+        # Saved before the manifest, so the manifest never lists vectors that are not on disk
+        vector_store.save()
+    manifest.save()
+    stats["fingerprint"] = repository_fingerprint(manifest)
+    logger.info(
+        "[🗂️] Indexed %s: %d added, %d changed, %d removed, %d unchanged (%d chunks embedded)",
+        path, stats["added"], stats["changed"], stats["removed"], stats["unchanged"], stats["chunks"],
+    )
+    return stats
+
+
+def _store_aliases(vector_store, deduplicator, batch_size):
+    """
+    Adds the alias metadata to kept chunks. They were embedded before all their
+    duplicates were seen, so they are re-added under the same ID; the embedding
+    cache makes that a lookup rather than a new embedding call.
+    """
+    ids = list(deduplicator.aliases)
+    for start in range(0, len(ids), batch_size):
+        docs = vector_store.get_by_ids(ids[start:start + batch_size])
+        for doc in docs:
+            doc.metadata.update(deduplicator.aliases_metadata(doc.id))
+        if docs:
+            vector_store.add_documents(docs, ids=[doc.id for doc in docs])
+
+
+def _prune_aliases(vector_store, manifest, batch_size):
+    """
+    Removes, from the metadata of kept chunks, the aliases in files that were
+    removed or changed since the alias was recorded. Those files no longer hold
+    the duplicate, or are embedded themselves.
+    """
+    stale = {}
+    for entry in manifest.files.values():
+        aliased_by = entry.get("aliased_by")
+        if not aliased_by:
+            continue
+        for key, files in list(aliased_by.items()):
+            gone = [file for file, digest in files.items() if manifest.files.get(file, {}).get("hash") != digest]
+            if not gone:
+                continue
+            stale[key] = gone
+            for file in gone:
+                del files[file]
+            if not files:
+                del aliased_by[key]
+
+    ids = list(stale)
+    for start in range(0, len(ids), batch_size):
+        docs = vector_store.get_by_ids(ids[start:start + batch_size])
+        for doc in docs:
+            gone = stale[doc.id]
+            aliases = [
+                alias for alias in doc.metadata.get("aliases", "").split(", ")
+                if alias and not any(alias == file or alias.startswith(file + ":") for file in gone)
+            ]
+            # Emptied rather than deleted: some stores merge metadata on upsert
+            doc.metadata.update({"aliases": ", ".join(aliases), "alias_count": len(aliases)})
+        if docs:
+            vector_store.add_documents(docs, ids=[doc.id for doc in docs])
+
+
+def _delete_ids(vector_store, ids):
+    if ids:
+        vector_store.delete(ids=ids)
+
+
+def repository_fingerprint(manifest):
+    """
+    Hash of every indexed file and its content hash: two indexes with the same
+    fingerprint hold the same code.
+    """
+    digest = hashlib.sha256()
+    for file in sorted(manifest.files):
+        digest.update(f"{file}\0{manifest.files[file]['hash']}\n".encode("utf-8"))
+    return digest.hexdigest()
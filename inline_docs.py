@@ -1,16 +1,23 @@
 import asyncio
+import logging
+import re
+import sys
 import time
 import os
 
-from langchain_ollama.llms import OllamaLLM
-from langchain.chat_models import ChatOpenAI 
-from dotenv import load_dotenv
-
 from langchain.prompts.chat import ChatPromptTemplate
 from langchain.schema import BaseOutputParser
 
-from files import scan_subfolders, read_contents
-from templates import inline_doc_templates, user_template
+from files import scan_subfolders, aiter_contents
+from journal import RunJournal, atomic_write
+from llm_cache import enable_llm_cache, is_cached
+from llm_engine import LLMScheduler, RateLimiter
+from metrics import configure_logging, metrics
+from models import get_model
+import streaming
+from chunking import chunk_code
+from templates import batch_template, inline_doc_templates, segment_template, user_template
+from tokens import count_tokens
 
 from const import paths
 
@@ -18,48 +25,348 @@ class SimpleOutputParser(BaseOutputParser):
     def parse(self, text: str) -> str:
         return text.strip()
 
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
+
+class SegmentOutputParser(BaseOutputParser):
+    """
+    Like SimpleOutputParser, but keeps the indentation of the first line, since a
+    segment can start inside a class body.
+    """
+    def parse(self, text: str) -> str:
+        return re.sub(r"^(?:[ \t]*\n)+", "", text).rstrip() + "\n"
+
+
+_chains = {}
+
+
+def build_chain(llm, template=user_template):
+    """
+    Compiles the documentation prompt and chain once; every file reuses it.
+    """
+    prompt = ChatPromptTemplate.from_template(inline_doc_templates + "\n\n" + template)
+    parser = SegmentOutputParser() if template == segment_template else SimpleOutputParser()
+    return prompt | llm | parser
+
+
+def get_chain(llm=None, template=user_template):
+    llm = llm or get_model()
+    key = (id(llm), template)
+    if key not in _chains:
+        _chains[key] = build_chain(llm, template)
+    return _chains[key]
+
+
+def result_path(file_path: str) -> str:
+    return "./doc_results/"+file_path
+
+
+def write_result(file_path: str, result: str):
+    atomic_write(result_path(file_path), result)
 
-# model = OllamaLLM(model="llama3.2:1b",keep_alive=True,top_k=1)
-model = ChatOpenAI(openai_api_key = api_key)
 
-# Async function to process a single file
-def process_file(file_path: str, code: str, extension: str):
-    print(f"[✏️] Documenting: {file_path} ({extension})")
-    prompt = ChatPromptTemplate.from_template(inline_doc_templates + "\n\n" + user_template)
-    chain = prompt | model | SimpleOutputParser()
-    
+def process_file(file_path: str, code: str, extension: str, chain=None, stream=None):
+    logger.debug("[✏️] Documenting: %s (%s)", file_path, extension)
+    chain = chain or get_chain()
     try:
-        result = chain.invoke({"code": code, "language": extension})
-        full_path = "./doc_results/"+file_path
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        with open(full_path, "w", encoding="utf-8") as f:
-            print("result")
-            f.write(result)
-        print(f"[✅] Finished: {file_path}")
+        if streaming.stream_outputs if stream is None else stream:
+            streaming.stream_to_file(chain.first, chain.steps[1], {"code": code, "language": extension},
+                                     result_path(file_path), streaming.StripFilter)
+        else:
+            result = chain.invoke({"code": code, "language": extension})
+            write_result(file_path, result)
+        logger.debug("[✅] Finished: %s", file_path)
     except Exception as e:
-        print(f"[❌] Error processing {file_path}: {e}")
+        logger.error("[❌] Error processing %s: %s", file_path, e)
+
+
+def preserves_code(original: str, documented: str) -> bool:
+    """
+    True if every non-blank line of `original` appears unchanged, and in order,
+    in `documented`; documentation may only add lines around them.
+    """
+    documented_lines = (line.rstrip() for line in documented.splitlines())
+    for line in original.splitlines():
+        line = line.rstrip()
+        if line.strip() and not any(candidate == line for candidate in documented_lines):
+            return False
+    return True
+
+
+def file_preamble(file_path: str, code: str, segments: list) -> str:
+    """
+    Shared context sent with every segment of a file: its name, imports and the
+    symbols each part defines.
+    """
+    imports = [
+        line.rstrip() for line in code.splitlines()
+        if re.match(r"\s*(import|from|#include|using|require|package|use)\b", line)
+    ][:20]
+    parts = [
+        f"- part {i}: lines {segment['start_line']}-{segment['end_line']}"
+        + (f" ({segment['symbol']})" if segment["symbol"] else "")
+        for i, segment in enumerate(segments, start=1)
+    ]
+    return "\n".join([f"File: {os.path.basename(file_path)}"] + imports + ["Parts:"] + parts)
+
+
+async def _invoke(chain, inputs, scheduler, tokens):
+    if is_cached(chain.steps[1], chain.first.format_messages(**inputs)):
+        # Served from the LLM cache: no API call, so no rate limiting either
+        return await chain.ainvoke(inputs)
+    return await scheduler.run(lambda: chain.ainvoke(inputs), tokens)
+
+
+async def document_segments(file_path, code, extension, llm, scheduler, segment_tokens):
+    """
+    Documents an oversized file as top-level-definition segments in parallel and
+    stitches the results back in order. A segment whose documented version does
+    not contain its original lines unchanged is kept undocumented.
+    """
+    segments = chunk_code(code, extension, segment_tokens)
+    preamble = file_preamble(file_path, code, segments)
+    chain = get_chain(llm, segment_template)
+    base_tokens = count_tokens(inline_doc_templates) + count_tokens(preamble)
+
+    async def one(i, segment):
+        inputs = {"code": segment["text"], "language": extension, "part": i,
+                  "parts": len(segments), "preamble": preamble}
+        result = await _invoke(chain, inputs, scheduler, base_tokens + 2 * count_tokens(segment["text"]))
+        if not preserves_code(segment["text"], result):
+            logger.warning("[⚠️] %s lines %s-%s: code changed, keeping original",
+                           file_path, segment["start_line"], segment["end_line"])
+            metrics.count("segments_rejected_total")
+            return segment["text"]
+        # Keep the blank lines that separated this segment from the next one
+        text = segment["text"]
+        return result.rstrip() + text[len(text.rstrip()):]
+
+    results = await asyncio.gather(*(one(i, segment) for i, segment in enumerate(segments, start=1)))
+    return "".join(results)
+
+
+async def _stream(chain, inputs, path, scheduler, tokens):
+    llm = chain.steps[1]
+    call = lambda: streaming.astream_to_file(chain.first, llm, inputs, path, streaming.StripFilter)
+    if is_cached(llm, chain.first.format_messages(**inputs)):
+        return await call()
+    return await scheduler.run(call, tokens)
+
+
+async def document_file(file, llm, scheduler, segment_tokens=3000, stream=False):
+    """
+    Documents one file record through the scheduler and writes the result.
+    Files over `segment_tokens` tokens are split and documented in segments.
+    With `stream`, a file documented in one request is streamed to its result
+    file as it is generated; segments are checked before they are written, so
+    they are not streamed.
+    """
+    file_path, code, extension = file["filePath"], file["contents"], file["extension"]
+    logger.debug("[✏️] Documenting: %s (%s)", file_path, extension)
+    if segment_tokens and count_tokens(code) > segment_tokens:
+        result = await document_segments(file_path, code, extension, llm, scheduler, segment_tokens)
+    else:
+        # Prompt plus a full copy of the code coming back
+        tokens = count_tokens(inline_doc_templates) + 2 * count_tokens(code)
+        inputs = {"code": code, "language": extension}
+        if stream:
+            await _stream(get_chain(llm), inputs, result_path(file_path), scheduler, tokens)
+            metrics.count("files_documented_total")
+            logger.debug("[✅] Finished: %s", file_path)
+            return
+        result = await _invoke(get_chain(llm), inputs, scheduler, tokens)
+    await asyncio.to_thread(write_result, file_path, result)
+    metrics.count("files_documented_total")
+    logger.debug("[✅] Finished: %s", file_path)
+
+
+def pack_batch_prompt(batch: list) -> str:
+    """
+    Wraps each file of a batch in numbered <<<FILE n>>> / <<<END FILE n>>> markers.
+    """
+    parts = []
+    for n, file in enumerate(batch, start=1):
+        name = os.path.basename(file["filePath"])
+        parts.append(f"<<<FILE {n}: {name} ({file['extension']})>>>\n{file['contents'].rstrip()}\n<<<END FILE {n}>>>")
+    return "\n\n".join(parts)
+
+
+batch_file_pattern = re.compile(r"^<<<FILE (\d+)[^\n]*>>>[ \t]*\n(.*?)\n?^<<<END FILE \1>>>[ \t]*$", re.DOTALL | re.MULTILINE)
+
+
+def unpack_batch_response(batch: list, response: str) -> dict:
+    """
+    Splits a batch response back into {batch index: documented code}, keeping only
+    files that appear exactly once and whose original code survived unchanged.
+    """
+    found = {}
+    duplicated = set()
+    for m in batch_file_pattern.finditer(response):
+        idx = int(m.group(1)) - 1
+        if idx in found:
+            duplicated.add(idx)
+        found[idx] = m.group(2).strip("\n") + "\n"
+    return {
+        idx: text for idx, text in found.items()
+        if 0 <= idx < len(batch) and idx not in duplicated and preserves_code(batch[idx]["contents"], text)
+    }
+
+
+async def document_batch(batch: list, llm, scheduler) -> list:
+    """
+    Documents several small files in one request and writes the ones that came
+    back intact. Returns the files that still need to be documented on their own.
+    """
+    for file in batch:
+        logger.debug("[✏️] Documenting: %s (%s) [batch of %d]", file["filePath"], file["extension"], len(batch))
+    files_text = pack_batch_prompt(batch)
+    tokens = count_tokens(inline_doc_templates) + 2 * count_tokens(files_text)
+    response = await _invoke(get_chain(llm, batch_template), {"count": len(batch), "files": files_text}, scheduler, tokens)
+
+    documented = unpack_batch_response(batch, response)
+    for idx, text in documented.items():
+        await asyncio.to_thread(write_result, batch[idx]["filePath"], text)
+        metrics.count("files_documented_total")
+        logger.debug("[✅] Finished: %s", batch[idx]["filePath"])
+    leftovers = [file for idx, file in enumerate(batch) if idx not in documented]
+    if leftovers:
+        metrics.count("batch_leftovers_total", len(leftovers))
+        logger.warning("[↩️] Batch response malformed for %d of %d files, re-sending them alone", len(leftovers), len(batch))
+    return leftovers
+
 
 # Run all file processes in parallel
-async def run_all(read_files: list):
-    # MAX_CONCURRENT_TASKS = 3
-    # semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
+async def run_all(read_files, llm=None, max_concurrency=8, requests_per_minute=3500,
+                  tokens_per_minute=90_000, max_retries=5, segment_tokens=3000,
+                  small_file_tokens=600, batch_tokens=3000, batch_max_files=10, scheduler=None,
+                  journal=None, repo="", stream=None):
+    """
+    Documents every record of `read_files`, which can be a list or an async stream
+    such as `files.aiter_contents`; work starts as soon as each record arrives.
+    At most `max_concurrency` requests are in flight, within the requests/min and
+    tokens/min limits, and failed requests are retried with backoff. Files over
+    `segment_tokens` tokens are documented in parallel segments (0 disables this).
+    Files under `small_file_tokens` are packed together, up to `batch_tokens` and
+    `batch_max_files` per request (batch_max_files=1 disables batching).
+    A `scheduler` shared with other work replaces the concurrency, rate and
+    retry settings. Every written file is recorded in `journal` under `repo`.
+    With `stream` (default: `streaming.stream_outputs`), files documented on
+    their own are streamed to disk as they are generated.
+    Returns the scheduler report plus the list of files that still failed.
+    """
+    llm = llm or get_model()
+    stream = streaming.stream_outputs if stream is None else stream
+    if scheduler is None:
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        scheduler = LLMScheduler(max_concurrency, limiter, max_retries=max_retries)
+    # Bounds how many records are held in memory while waiting for a slot
+    window = asyncio.Semaphore(max_concurrency * 2 + batch_max_files)
+    failed = []
+
+    def done(file):
+        if journal is not None:
+            journal.record(repo, "docs", file["filePath"], output=result_path(file["filePath"]))
+
+    async def document_one(file):
+        try:
+            await document_file(file, llm, scheduler, segment_tokens, stream)
+            done(file)
+        except Exception as e:
+            failed.append(file["filePath"])
+            metrics.count("files_failed_total")
+            logger.error("[❌] Error processing %s: %s", file["filePath"], e)
+
     async def wrapped(file):
-        # async with semaphore:
-        await asyncio.to_thread(process_file, file["filePath"], file["contents"], file["extension"])
-    tasks = [wrapped(file) for file in read_files]
+        try:
+            await document_one(file)
+        finally:
+            window.release()
+
+    async def wrapped_batch(batch):
+        try:
+            try:
+                leftovers = await document_batch(batch, llm, scheduler)
+            except Exception as e:
+                logger.warning("[↩️] Batch of %d files failed (%s), re-sending them alone", len(batch), e)
+                leftovers = batch
+            for file in batch:
+                if file not in leftovers:
+                    done(file)
+            await asyncio.gather(*(document_one(file) for file in leftovers))
+        finally:
+            for _ in batch:
+                window.release()
+
+    tasks = []
+    batch, batch_size = [], 0
+
+    def flush():
+        nonlocal batch, batch_size
+        if len(batch) == 1:
+            tasks.append(asyncio.create_task(wrapped(batch[0])))
+        elif batch:
+            tasks.append(asyncio.create_task(wrapped_batch(batch)))
+        batch, batch_size = [], 0
+
+    async def schedule(file):
+        nonlocal batch_size
+        await window.acquire()
+        tokens = count_tokens(file["contents"]) if batch_max_files > 1 else small_file_tokens
+        if tokens >= small_file_tokens:
+            tasks.append(asyncio.create_task(wrapped(file)))
+            return
+        if batch and (batch_size + tokens > batch_tokens or len(batch) >= batch_max_files):
+            flush()
+        batch.append(file)
+        batch_size += tokens
+
+    if hasattr(read_files, "__aiter__"):
+        async for file in read_files:
+            await schedule(file)
+    else:
+        for file in read_files:
+            await schedule(file)
+    flush()
     await asyncio.gather(*tasks)
 
+    logger.info(scheduler.summary())
+    for file_path in failed:
+        logger.warning("[❌] Not documented: %s", file_path)
+    report = scheduler.report()
+    report["failed_files"] = failed
+    return report
+
+
+async def document_repository(path, llm=None, scheduler=None, journal=None, files=None):
+    """
+    Documents every scanned file of the repository at `path` (or the already
+    scanned `files`), skipping the files that `journal` already records with an
+    intact output.
+    """
+    resultant_files = scan_subfolders(path=path) if files is None else files
+    if journal is not None:
+        pending = [file for file in resultant_files if not journal.is_done(path, "docs", file)]
+        if len(pending) < len(resultant_files):
+            logger.info("[⏭️] Resuming: %d files already documented", len(resultant_files) - len(pending))
+        resultant_files = pending
+    logger.info("[📄] Found %d files to document.", len(resultant_files))
+    with metrics.span("docs", repo=path):
+        return await run_all(aiter_contents(resultant_files), llm, scheduler=scheduler, journal=journal, repo=path)
+
 if __name__ == "__main__":
-    print("[🔍] Scanning files...")
+    configure_logging()
+    logger.info("[🔍] Scanning files...")
     start = time.time()
+    llm_cache = enable_llm_cache()
+
+    # --resume skips repositories and files that a previous, interrupted run completed
+    journal = RunJournal("inline_docs", resume="--resume" in sys.argv)
 
     for idx in range(len(paths)):
+        with metrics.span("repository", repo=paths[idx]):
+            asyncio.run(document_repository(paths[idx], journal=journal))
+        logger.info("[🎉] Documentation completed in %.2fs", time.time() - start)
+    journal.close()
 
-        resultant_files = scan_subfolders(path=paths[idx])
-        read_files = read_contents(resultant_files)
-        print(f"[📄] Found {len(read_files)} files to document.\n")
-        asyncio.run(run_all(read_files))
-        print(f"\n[🎉] Documentation completed in {time.time() - start:.2f}s")
-    
\ No newline at end of file
+    if llm_cache is not None:
+        logger.info(llm_cache.summary())
+    metrics.export()
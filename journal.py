@@ -0,0 +1,164 @@
+import atexit
+import fcntl
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+journal_directory = "./journal"
+
+# Several writers on one thread (coroutines) still get their own temporary files
+_tmp_ids = itertools.count()
+
+
+def atomic_write(path, text):
+    """
+    Writes `text` to `path` through a temporary file in the same directory and a
+    rename, so readers (and a resumed run) see either the old file or the
+    complete new one, never a half-written file.
+    """
+    with atomic_open(path) as f:
+        f.write(text)
+
+
+@contextmanager
+def atomic_open(path):
+    """
+    `atomic_write` for output produced piece by piece: yields the temporary
+    file, which replaces `path` only when the block completes. If the block
+    raises, the temporary file is removed and `path` is left untouched.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}.{next(_tmp_ids)}"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def file_digest(path):
+    """
+    sha256 of the file at `path`, or None if it cannot be read.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class RunJournal:
+    """
+    Append-only JSONL record of the units of work a run has completed, keyed by
+    (repository, stage, item). A unit can be a whole repository stage or a
+    single file.
+
+    Entries are buffered and appended in one write under an exclusive `flock`,
+    followed by one fsync. This happens every `flush_every` entries or
+    `flush_interval` seconds, and at exit. Several threads or processes can
+    share a journal file. A crash loses at most the last unflushed entries,
+    which are then simply redone. A torn last line is ignored when the journal
+    is read back.
+
+    Without `resume` the journal is started afresh. With `resume` the
+    completed units are loaded, and `is_done` also checks that the recorded
+    output still exists with the recorded hash.
+    """
+
+    def __init__(self, name, resume=False, directory=journal_directory, flush_every=64, flush_interval=2.0):
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.completed = {}
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        if resume:
+            self._load()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | (0 if resume else os.O_TRUNC), 0o644)
+        atexit.register(self.close)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.completed[(entry["repo"], entry["stage"], entry["item"])] = entry
+        except FileNotFoundError:
+            pass
+
+    def is_done(self, repo, stage, item=""):
+        """
+        True if the unit was completed and its output, if it had one, is intact.
+        """
+        entry = self.completed.get((repo, stage, item))
+        if entry is None:
+            return False
+        if entry.get("output") and file_digest(entry["output"]) != entry.get("sha256"):
+            logger.warning("[⚠️] %s is missing or changed, redoing %s for %s", entry["output"], stage, item or repo)
+            return False
+        return True
+
+    def record(self, repo, stage, item="", output=None):
+        """
+        Marks a unit as completed, with the hash of its `output` file if any.
+        """
+        entry = {"repo": repo, "stage": stage, "item": item, "time": time.time()}
+        if output:
+            entry["output"] = output
+            entry["sha256"] = file_digest(output)
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self.completed[(repo, stage, item)] = entry
+            self._pending.append(line)
+            due = len(self._pending) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending or self._fd is None:
+                return
+            data = "".join(self._pending).encode("utf-8")
+            self._pending = []
+            self._last_flush = time.monotonic()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                while data:
+                    data = data[os.write(self._fd, data):]
+                os.fsync(self._fd)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
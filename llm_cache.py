@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import zlib
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+from disk_cache import DiskCache
+
+llm_cache_path = "./cache/llm_responses.sqlite"
+
+
+class DiskLLMCache(BaseCache):
+    """
+    Persistent LangChain LLM cache. The key is a hash of the serialized model
+    settings (`llm_string`: model name, temperature and other sampling
+    parameters) plus the rendered prompt. Responses are stored zlib-compressed
+    in a DiskCache with a size cap and an optional TTL.
+    """
+
+    def __init__(self, path=llm_cache_path, max_bytes=512 << 20, ttl=30 * 24 * 3600):
+        self.cache = DiskCache(path, max_bytes=max_bytes, ttl=ttl)
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        blob = self.cache.get(self._key(prompt, llm_string))
+        if blob is None:
+            return None
+        try:
+            entries = json.loads(zlib.decompress(blob))
+        except (zlib.error, ValueError):
+            return None
+        return [
+            ChatGeneration(message=AIMessage(content=e["text"]), generation_info=e["info"])
+            if e["chat"] else Generation(text=e["text"], generation_info=e["info"])
+            for e in entries
+        ]
+
+    def update(self, prompt, llm_string, return_val):
+        # Only the text is kept: these chains never use tool calls or other message fields
+        entries = [
+            {"text": g.text, "chat": isinstance(g, ChatGeneration), "info": g.generation_info}
+            for g in return_val
+        ]
+        blob = zlib.compress(json.dumps(entries).encode("utf-8"))
+        self.cache.set(self._key(prompt, llm_string), blob)
+
+    def clear(self, **kwargs):
+        self.cache.clear()
+
+    def summary(self):
+        stats = self.cache.stats()
+        return (
+            f"[💾] LLM cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} hit rate, {stats['bytes']} bytes stored)"
+        )
+
+
+def enable_llm_cache(enabled=None, **kwargs):
+    """
+    Installs a DiskLLMCache as LangChain's global LLM cache, so every chat model
+    call in the chains is served from disk when the same prompt was already sent.
+    Set LLM_CACHE=0 (or pass enabled=False) to opt out. Returns the cache or None.
+    """
+    if enabled is None:
+        enabled = os.getenv("LLM_CACHE", "1") != "0"
+    if not enabled:
+        set_llm_cache(None)
+        return None
+    cache = DiskLLMCache(**kwargs)
+    set_llm_cache(cache)
+    return cache
+
+
+def is_cached(llm, messages):
+    """
+    True if the global cache already holds the response of `llm` to `messages`,
+    computed the same way LangChain's chat models look it up. Callers use it to
+    skip rate limiting for requests that will not reach the API.
+    """
+    cache = get_llm_cache()
+    if not isinstance(cache, DiskLLMCache) or getattr(llm, "cache", None) is False:
+        return False
+    try:
+        key = cache._key(dumps(messages), llm._get_llm_string())
+    except Exception:
+        return False
+    return cache.cache.contains(key)
@@ -1,34 +1,237 @@
+import argparse
 import asyncio
-import time
+import logging
 import os
+import sys
 
-from langchain_ollama.llms import OllamaLLM
-from langchain.chat_models import ChatOpenAI 
-from dotenv import load_dotenv
+logger = logging.getLogger(__name__)
 
-from langchain.prompts.chat import ChatPromptTemplate
-from langchain.schema import BaseOutputParser
+# Same layout as pipeline.output_dir_for: one folder per repository collection
+default_output_directory = "./outputs"
 
-from templates import inline_doc_templates, user_template
-from files import scan_subfolders, read_contents
+# Results shared by the steps of one invocation, by repository path
+_scans = {}
+_stores = {}
 
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
+# Modules are imported inside the commands: `scan` and `--help` never load
+# LangChain, the vector stores or the API clients.
 
-# model = OllamaLLM(model="llama3.2:1b",keep_alive=True,top_k=1)
-model = ChatOpenAI(openai_api_key = api_key)
 
+def scanned_files(path):
+    """
+    Source files of the repository at `path`, scanned once per invocation.
+    """
+    if path not in _scans:
+        from files import scan_subfolders
 
+        _scans[path] = scan_subfolders(path)
+    return _scans[path]
 
-def read_all_file_contents():
-    return
-    
 
-if __name__ == "__main__":
-    print("[🔍] Scanning files...")
-    start = time.time()
+def indexed_store(path, backend=None):
+    """
+    Vector store of the repository at `path`, brought up to date once per
+    invocation.
+    """
+    if path not in _stores:
+        from indexing import index_repository, open_vector_store
+        from models import get_embeddings
+
+        vector_store = open_vector_store(path, get_embeddings(), backend)
+        index_repository(vector_store, path, files=scanned_files(path))
+        _stores[path] = vector_store
+    return _stores[path]
+
+
+def output_path_for(args, path, name):
+    from indexing import collection_name_for
+
+    return os.path.join(args.output_dir, collection_name_for(path), name)
+
+
+def scan(args):
+    for path in args.paths:
+        files = scanned_files(path)
+        if args.count:
+            print(f"{len(files)}\t{path}")
+        else:
+            print("\n".join(files))
+
+
+def index(args):
+    for path in args.paths:
+        indexed_store(path, args.backend)
+
+
+def docs(args):
+    from inline_docs import document_repository
+    from journal import RunJournal
+    from models import get_model
+
+    with RunJournal("inline_docs", resume=args.resume) as journal:
+        for path in args.paths:
+            report = asyncio.run(document_repository(path, get_model(args.model), journal=journal,
+                                                     files=scanned_files(path)))
+            if report["failed_files"]:
+                logger.warning("[⚠️] %d files of %s not documented", len(report["failed_files"]), path)
+
+
+def readme(args):
+    from journal import RunJournal
+    from models import get_model, summary_model_name
+    from readme_generation import generate_readme_with_rag, generate_readme_with_summary_tree
+
+    model = get_model(args.model)
+    with RunJournal("readme", resume=args.resume) as journal:
+        for idx, path in enumerate(args.paths):
+            if journal.is_done(path, "readme"):
+                logger.info("[⏭️] README already generated for %s", path)
+                continue
+            output_path = output_path_for(args, path, "README.md")
+            if args.summary_tree:
+                output = generate_readme_with_summary_tree(path, model, idx, get_model(summary_model_name),
+                                                           output_path, files=scanned_files(path))
+            else:
+                output = generate_readme_with_rag(indexed_store(path, args.backend), model, idx,
+                                                  output_path=output_path)
+            journal.record(path, "readme", output=output)
+            logger.info("[📄] %s", output)
+
+
+def diagram(args):
+    from archi_diagram import generate_diagram_from_graph, generate_diagram_with_rag
+    from journal import RunJournal
+    from models import get_model
+
+    model = get_model(args.model)
+    with RunJournal("diagram", resume=args.resume) as journal:
+        for idx, path in enumerate(args.paths):
+            if journal.is_done(path, "diagram"):
+                logger.info("[⏭️] Diagram already generated for %s", path)
+                continue
+            output_path = output_path_for(args, path, "architecture.md")
+            if args.rag:
+                output = generate_diagram_with_rag(indexed_store(path, args.backend), model, idx,
+                                                   output_path=output_path)
+            else:
+                output = generate_diagram_from_graph(path, model, idx, output_path=output_path,
+                                                     files=scanned_files(path))
+            journal.record(path, "diagram", output=output)
+            logger.info("[📄] %s", output)
+
 
-    resultant_files = scan_subfolders()
-    read_files = read_contents(resultant_files)
-    
-    
\ No newline at end of file
+def generate_all(args):
+    import indexing
+    import pipeline
+    from journal import RunJournal
+    from models import get_embeddings, get_model
+
+    pipeline.output_directory = args.output_dir
+    if args.backend:
+        indexing.vector_store_backend = args.backend
+    with RunJournal("pipeline", resume=args.resume) as journal:
+        outcomes = asyncio.run(pipeline.run_repositories(
+            args.paths, get_embeddings(), get_model(args.model), args.artifacts,
+            max_workers=args.workers, journal=journal,
+        ))
+    if any(isinstance(outcome, Exception) or any(outcome.values()) for outcome in outcomes.values()):
+        return 1
+
+
+def watch(args):
+    import pipeline
+    from models import get_embeddings, get_model
+    from watcher import watch_repositories
+
+    pipeline.output_directory = args.output_dir
+    try:
+        asyncio.run(watch_repositories(
+            args.paths, get_embeddings(), get_model(args.model), args.artifacts, not args.no_docs,
+            args.regenerate_after, args.debounce, poll_interval=args.poll, backend=args.backend,
+        ))
+    except KeyboardInterrupt:
+        logger.info("[👋] Stopped watching")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py", description="Scan, index and document source repositories with an LLM.",
+    )
+    parser.add_argument("--log-level", default=None, help="DEBUG shows every file (default: LOG_LEVEL or INFO)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def command(name, handler, help, llm=False, store=False, journal=False, output=False):
+        sub = commands.add_parser(name, help=help, description=help)
+        sub.add_argument("paths", nargs="+", metavar="PATH", help="repository paths")
+        if llm:
+            sub.add_argument("--model", default=None, help="chat model name (default: the ChatOpenAI default)")
+            sub.add_argument("--no-llm-cache", action="store_true", help="always call the API")
+            sub.add_argument("--stream", action="store_true",
+                             help="stream responses to the output files as they are generated (default: STREAM_OUTPUTS)")
+        if store:
+            sub.add_argument("--backend", choices=("chroma", "numpy"), default=None,
+                             help="vector store (default: VECTOR_STORE or chroma)")
+        if journal:
+            sub.add_argument("--resume", action="store_true", help="skip work an interrupted run completed")
+        if output:
+            sub.add_argument("--output-dir", default=default_output_directory,
+                             help=f"one folder per repository under it (default: {default_output_directory})")
+        sub.set_defaults(handler=handler, uses_llm=llm)
+        return sub
+
+    command("scan", scan, "List the source files that would be indexed and documented.").add_argument(
+        "--count", action="store_true", help="print only the number of files per repository")
+    command("index", index, "Embed new and changed files into the vector store.", store=True)
+    command("docs", docs, "Write inline documentation for every file to doc_results/.", llm=True, journal=True)
+    command("readme", readme, "Generate a README.md per repository.", llm=True, store=True, journal=True,
+            output=True).add_argument("--summary-tree", action="store_true",
+                                      help="summarize the whole repository bottom-up instead of retrieving chunks")
+    command("diagram", diagram, "Generate a Mermaid architecture diagram per repository.", llm=True, store=True,
+            journal=True, output=True).add_argument("--rag", action="store_true",
+                                                    help="use retrieved chunks instead of the dependency graph")
+    run = command("all", generate_all, "Index each repository once and generate all artifacts concurrently.",
+                  llm=True, store=True, journal=True, output=True)
+    run.add_argument("--artifacts", nargs="+", choices=("readme", "diagram", "docs"),
+                     default=["readme", "diagram", "docs"])
+    run.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    daemon = command("watch", watch, "Keep the index, inline docs and artifacts up to date as files change.",
+                     llm=True, store=True, output=True)
+    daemon.add_argument("--artifacts", nargs="*", choices=("readme", "diagram"), default=["readme", "diagram"],
+                        help="artifacts to regenerate (none: only the index and docs)")
+    daemon.add_argument("--regenerate-after", type=int, default=20, metavar="N",
+                        help="regenerate the artifacts once N files have changed (default: 20)")
+    daemon.add_argument("--debounce", type=float, default=0.5, metavar="SECONDS",
+                        help="quiet time that ends a burst of changes (default: 0.5)")
+    daemon.add_argument("--poll", type=float, default=None, metavar="SECONDS",
+                        help="poll for changes at this interval instead of using inotify")
+    daemon.add_argument("--no-docs", action="store_true", help="do not re-document changed files")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    from metrics import configure_logging, metrics
+
+    configure_logging(args.log_level)
+    llm_cache = None
+    if args.uses_llm:
+        from llm_cache import enable_llm_cache
+
+        llm_cache = enable_llm_cache(False if args.no_llm_cache else None)
+        if args.stream:
+            import streaming
+
+            streaming.stream_outputs = True
+
+    status = args.handler(args)
+
+    if llm_cache is not None:
+        logger.info(llm_cache.summary())
+    if args.command != "scan":
+        metrics.export()
+    return status or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
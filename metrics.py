@@ -0,0 +1,331 @@
+import json
+import logging
+import copy
+import math
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+from journal import atomic_write
+
+logger = logging.getLogger(__name__)
+
+metrics_directory = "./metrics"
+
+# USD per 1M (input, output) tokens, matched by the longest model name prefix
+model_prices = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of `values` (q in 0-100).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens=0):
+    """
+    Estimated USD cost of a call, or 0.0 for a model without a known price.
+    """
+    matches = [name for name in model_prices if (model or "").startswith(name)]
+    if not matches:
+        return 0.0
+    input_price, output_price = model_prices[max(matches, key=len)]
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def configure_logging(level=None):
+    """
+    Leveled console logging for the scripts. LOG_LEVEL=DEBUG brings back the
+    per-file progress lines.
+    """
+    logging.basicConfig(level=level or os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+
+
+class Histogram:
+    """
+    Count, sum, min and max of every observation, plus a uniform reservoir
+    sample of at most `max_samples` values for the percentiles.
+    """
+
+    def __init__(self, max_samples=10_000):
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.samples = []
+        self.max_samples = max_samples
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            idx = random.randrange(self.count)
+            if idx < self.max_samples:
+                self.samples[idx] = value
+
+    def merge(self, other):
+        """
+        Adds the observations of `other`, e.g. a histogram recorded in a worker.
+        """
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.samples.extend(other.samples)
+        if len(self.samples) > self.max_samples:
+            self.samples = random.sample(self.samples, self.max_samples)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": percentile(self.samples, 50),
+            "p95": percentile(self.samples, 95),
+            "p99": percentile(self.samples, 99),
+        }
+
+
+class _Span:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe("stage_seconds", time.perf_counter() - self.start, stage=self.name, **self.labels)
+        if exc_type is not None:
+            self.metrics.count("stage_errors_total", stage=self.name, **self.labels)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class Metrics:
+    """
+    Process-wide counters, histograms and stage spans, keyed by name and labels
+    (e.g. stage="scan", repo=path). Thread-safe. Exported as a JSON run report
+    or a Prometheus textfile.
+
+    When disabled (METRICS=0), every recording call returns right away and
+    `span` hands out one shared no-op context manager.
+    """
+
+    def __init__(self, enabled=True, max_samples=10_000):
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.max_samples)
+            histogram.observe(value)
+
+    def span(self, stage, **labels):
+        """
+        Context manager timing one run of `stage` into the "stage_seconds"
+        histogram. An exception escaping it is counted in "stage_errors_total".
+        """
+        if not self.enabled:
+            return _null_span
+        return _Span(self, stage, labels)
+
+    def record_usage(self, model, prompt_tokens, completion_tokens=0, kind="llm"):
+        """
+        Token counts and estimated cost of one billed API call.
+        """
+        if not self.enabled:
+            return
+        self.count(f"{kind}_calls_total", model=model)
+        self.count(f"{kind}_tokens_total", prompt_tokens, model=model, type="prompt")
+        if completion_tokens:
+            self.count(f"{kind}_tokens_total", completion_tokens, model=model, type="completion")
+        self.count("cost_usd_total", estimate_cost(model, prompt_tokens, completion_tokens), model=model)
+
+    def snapshot(self):
+        """
+        Copy of the counters and histograms, e.g. to send them back from a
+        worker process to be merged into the parent's.
+        """
+        with self._lock:
+            return {"counters": dict(self.counters), "histograms": copy.deepcopy(self.histograms)}
+
+    def merge(self, snapshot):
+        """
+        Adds the counters and histograms of a `snapshot` to these.
+        """
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in snapshot["histograms"].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(self.max_samples)
+                histogram.merge(other)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started = time.time()
+
+    def report(self):
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [dict({"name": name, "labels": dict(labels)}, **histogram.summary())
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+        cost = sum(c["value"] for c in counters if c["name"] == "cost_usd_total")
+        return {
+            "started": self.started,
+            "elapsed": time.time() - self.started,
+            "cost_usd": cost,
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def write_report(self, path=None):
+        """
+        Writes the JSON run report, by default to metrics/run_<time>.json.
+        Returns its path.
+        """
+        path = path or os.path.join(metrics_directory, f"run_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        atomic_write(path, json.dumps(self.report(), indent=2))
+        return path
+
+    def prometheus_text(self, prefix="code_reader"):
+        """
+        The metrics in the Prometheus text format: counters as counters and
+        histograms as summaries with 0.5/0.95/0.99 quantiles.
+        """
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+        typed = set()
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = f"{prefix}_{name}"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{labels_text(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                metric = f"{prefix}_{name}"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} summary")
+                summary = histogram.summary()
+                for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                    lines.append(f"{metric}{labels_text(labels, [('quantile', quantile)])} {summary[key]}")
+                lines.append(f"{metric}_sum{labels_text(labels)} {summary['sum']}")
+                lines.append(f"{metric}_count{labels_text(labels)} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Writes a textfile for the node_exporter textfile collector. The write is
+        atomic, so the collector never scrapes half a file.
+        """
+        atomic_write(path, self.prometheus_text())
+        return path
+
+    def export(self, report_path=None, textfile=None):
+        """
+        End-of-run export: the JSON report, plus a Prometheus textfile when
+        `textfile` or METRICS_TEXTFILE is set. Logs the summary and returns the
+        report path, or None when metrics are disabled.
+        """
+        if not self.enabled:
+            return None
+        report_path = self.write_report(report_path)
+        textfile = textfile or os.getenv("METRICS_TEXTFILE")
+        if textfile:
+            self.write_prometheus(textfile)
+        logger.info(self.summary())
+        logger.info("[💾] Metrics report written to %s", report_path)
+        return report_path
+
+    def summary(self):
+        report = self.report()
+        # Time per stage, summed over repositories
+        stages = {}
+        for h in report["histograms"]:
+            if h["name"] == "stage_seconds":
+                stages[h["labels"]["stage"]] = stages.get(h["labels"]["stage"], 0.0) + h["sum"]
+        parts = [f"{stage} {seconds:.2f}s" for stage, seconds in stages.items()]
+        return f"[📈] {', '.join(parts) or 'no stages'}; estimated API cost ${report['cost_usd']:.4f}"
+
+
+metrics = Metrics(enabled=os.getenv("METRICS", "1") != "0")
+
+
+def run_recorded(fn, *args):
+    """
+    Runs `fn(*args)` for `run_in_executor` and returns (result, snapshot of the
+    metrics it recorded). In a pool worker, whose metrics would otherwise be
+    lost, the snapshot is for the parent to `merge`. In the main process the
+    metrics are already in place and the snapshot is None.
+    """
+    if multiprocessing.parent_process() is None:
+        return fn(*args), None
+    # A worker runs one task at a time, so everything since the reset is this task's
+    metrics.reset()
+    return fn(*args), metrics.snapshot()
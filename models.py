@@ -0,0 +1,88 @@
+import os
+import time
+from functools import lru_cache
+
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+
+from metrics import metrics
+
+load_dotenv()
+
+default_model_name = None  # the ChatOpenAI default
+# Cheaper model for the per-file and per-directory summaries of --summary-tree
+summary_model_name = "gpt-4o-mini"
+embedding_model_name = "text-embedding-3-large"
+
+
+class UsageCallback(BaseCallbackHandler):
+    """
+    LangChain callback that records latency, token usage and cost of every chat
+    model call into `metrics`. Responses served from the LLM cache carry no
+    token usage and are counted as cached instead of billed.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._calls = {}
+
+    def _start(self, run_id, serialized, kwargs):
+        if not self.metrics.enabled:
+            return
+        params = kwargs.get("invocation_params") or (serialized or {}).get("kwargs", {})
+        self._calls[run_id] = (time.perf_counter(), params.get("model_name") or params.get("model") or "unknown")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, serialized, kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, serialized, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        start, model = call
+        output = response.llm_output or {}
+        model = output.get("model_name") or model
+        self.metrics.observe("llm_request_seconds", time.perf_counter() - start, model=model)
+        usage = output.get("token_usage")
+        if usage:
+            self.metrics.record_usage(model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        elif "stream" in (kwargs.get("tags") or ()):
+            # Streamed responses report no usage; streaming.astream_to_file estimates it
+            pass
+        else:
+            self.metrics.count("llm_cached_total", model=model)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is not None:
+            self.metrics.count("llm_errors_total", model=call[1], error=type(error).__name__)
+
+
+usage_callback = UsageCallback(metrics)
+
+
+@lru_cache(maxsize=None)
+def get_model(model_name=default_model_name):
+    """
+    The shared chat model client, built on first use so that importing a module
+    (or running a command that never calls the API) does not pay for it.
+    """
+    from langchain.chat_models import ChatOpenAI
+
+    kwargs = {"model_name": model_name} if model_name else {}
+    return ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"), callbacks=[usage_callback], **kwargs)
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(model_name=embedding_model_name):
+    """
+    The shared embedding client, behind the persistent embedding cache.
+    """
+    from langchain_openai import OpenAIEmbeddings
+
+    from embedding_cache import CachedEmbeddings
+
+    return CachedEmbeddings(OpenAIEmbeddings(model=model_name))
@@ -0,0 +1,346 @@
+import json
+import os
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# Rows scored per matrix product, which bounds the temporary memory of a search
+search_block_rows = 65536
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-memory vector store for a single repository. Vectors are normalized once
+    on insert and kept in one contiguous matrix, so cosine top-k is a single
+    matrix product plus `argpartition`. For ranking that is the same as Chroma's
+    cosine search, with no database or persistence cost.
+
+    `dtype` is "float32", "float16" (half the memory) or "int8" (a quarter of
+    the memory, one float32 scale per row). `save`/`load` write plain .npy files
+    that are memory-mapped back in.
+    """
+
+    def __init__(self, embedding, dtype="float32", path=None):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported dtype {dtype!r}")
+        self.embedding = embedding
+        self.dtype = dtype
+        self.path = path
+        self._vectors = None
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        self._rows = {}
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def __len__(self):
+        return len(self._rows)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def add_texts(self, texts, metadatas=None, *, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = self.embedding.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas, ids)
+
+    def add_embeddings(self, texts, vectors, metadatas=None, ids=None):
+        """
+        Adds precomputed vectors. An existing ID is replaced, as in Chroma's upsert.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("Expected one vector per text")
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        self.delete([doc_id for doc_id in ids if doc_id in self._rows])
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        encoded, scales = self._encode(vectors)
+
+        start = self._size
+        self._reserve(start + len(texts), vectors.shape[1])
+        self._vectors[start:start + len(texts)] = encoded
+        self._scales[start:start + len(texts)] = scales
+        self._alive[start:start + len(texts)] = True
+        self._size += len(texts)
+        for offset, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+            self._rows[doc_id] = start + offset
+            self._ids.append(doc_id)
+            self._texts.append(text)
+            self._metadatas.append(dict(metadata or {}))
+        return ids
+
+    def _encode(self, vectors):
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(self.dtype), np.ones(len(vectors), dtype=np.float32)
+
+    def _reserve(self, rows, dim):
+        # Grow geometrically so that batched inserts stay amortized O(1) per row;
+        # this also copies a memory-mapped matrix into memory on the first write
+        if self._vectors is not None and self._vectors.shape[1] != dim:
+            raise ValueError(f"Expected {self._vectors.shape[1]}-dimensional vectors, got {dim}")
+        capacity = 0 if self._vectors is None else len(self._vectors)
+        if rows <= capacity and not isinstance(self._vectors, np.memmap):
+            return
+        capacity = max(rows, capacity * 2, 1024)
+        vectors = np.zeros((capacity, dim), dtype=self.dtype)
+        scales = np.zeros(capacity, dtype=np.float32)
+        alive = np.zeros(capacity, dtype=bool)
+        if self._size:
+            vectors[:self._size] = self._vectors[:self._size]
+            scales[:self._size] = self._scales[:self._size]
+            alive[:self._size] = self._alive[:self._size]
+        self._vectors, self._scales, self._alive = vectors, scales, alive
+
+    def delete(self, ids=None, **kwargs):
+        for doc_id in ids or []:
+            row = self._rows.pop(doc_id, None)
+            if row is not None:
+                self._alive[row] = False
+                self._texts[row] = None
+                self._metadatas[row] = None
+        # Compact once a quarter of the rows are dead
+        if self._size and len(self._rows) < self._size * 0.75:
+            self._compact()
+        return True
+
+    def _compact(self):
+        keep = np.flatnonzero(self._alive[:self._size])
+        self._vectors = np.ascontiguousarray(self._vectors[keep])
+        self._scales = self._scales[keep].copy()
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._ids = [self._ids[row] for row in keep]
+        self._texts = [self._texts[row] for row in keep]
+        self._metadatas = [self._metadatas[row] for row in keep]
+        self._size = len(keep)
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+
+    def get_by_ids(self, ids, /):
+        return [self._document(self._rows[doc_id]) for doc_id in ids if doc_id in self._rows]
+
+    def _document(self, row):
+        return Document(page_content=self._texts[row], metadata=dict(self._metadatas[row]), id=self._ids[row])
+
+    def _query_matrix(self, queries):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        return queries / np.where(norms == 0, 1, norms)
+
+    def top_k(self, queries, k):
+        """
+        Batched cosine top-k. Returns (rows, scores) arrays of shape
+        (len(queries), k), best first; rows are -1 where fewer than k vectors exist.
+        """
+        queries = self._query_matrix(queries)
+        k = min(k, len(self._rows))
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if k == 0:
+            return best_rows, best_scores
+        for start in range(0, self._size, search_block_rows):
+            end = min(start + search_block_rows, self._size)
+            block = self._vectors[start:end]
+            block = block.astype(np.float32) if self.dtype != "float32" else block
+            scores = queries @ block.T
+            if self.dtype == "int8":
+                scores *= self._scales[start:end]
+            scores[:, ~self._alive[start:end]] = -np.inf
+            # Keep the best k of this block and of the best so far
+            take = min(k, end - start)
+            part = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            rows = np.concatenate([best_rows, part + start], axis=1)
+            merged = np.concatenate([best_scores, np.take_along_axis(scores, part, axis=1)], axis=1)
+            keep = np.argpartition(-merged, k - 1, axis=1)[:, :k]
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+            best_scores = np.take_along_axis(merged, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows[~np.isfinite(best_scores)] = -1
+        return best_rows, best_scores
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        rows, scores = self.top_k(embedding, k)
+        return [(self._document(row), float(score)) for row, score in zip(rows[0], scores[0]) if row >= 0]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity in [-1, 1] mapped to [0, 1]
+        return lambda score: (score + 1) / 2
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        rows, scores = self.top_k(embedding, fetch_k)
+        candidates = rows[0][rows[0] >= 0]
+        if not len(candidates):
+            return []
+        relevance = scores[0][:len(candidates)]
+        vectors = self._vectors[candidates].astype(np.float32)
+        if self.dtype == "int8":
+            vectors *= self._scales[candidates][:, None]
+        similarity = vectors @ vectors.T
+
+        selected = [0]
+        # Highest similarity of every candidate to anything already selected
+        redundancy = similarity[0].copy()
+        while len(selected) < min(k, len(candidates)):
+            score = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+            score[selected] = -np.inf
+            best = int(np.argmax(score))
+            selected.append(best)
+            redundancy = np.maximum(redundancy, similarity[best])
+        return [self._document(candidates[i]) for i in selected]
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        return self.max_marginal_relevance_search_by_vector(self.embedding.embed_query(query), k, fetch_k, lambda_mult)
+
+    def memory_bytes(self):
+        """
+        Bytes used by the vector matrix and per-row arrays (documents excluded).
+        """
+        if self._vectors is None:
+            return 0
+        return self._vectors[:self._size].nbytes + self._scales[:self._size].nbytes + self._size
+
+    def save(self, path=None):
+        """
+        Writes the store to the directory `path` (default: the store's own path):
+        the vector matrix and row scales as .npy files plus one JSON file of IDs,
+        texts and metadata. Files are written next to the old ones and swapped in.
+        """
+        path = path or self.path
+        if self._size != len(self._rows):
+            self._compact()
+        os.makedirs(path, exist_ok=True)
+        dim = self._vectors.shape[1] if self._vectors is not None else 0
+        arrays = {
+            "vectors.npy": self._vectors[:self._size] if self._vectors is not None else np.zeros((0, 0), self.dtype),
+            "scales.npy": self._scales[:self._size],
+        }
+        for name, array in arrays.items():
+            with open(os.path.join(path, name + ".tmp"), "wb") as f:
+                np.save(f, array)
+        with open(os.path.join(path, "documents.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump({"dtype": self.dtype, "dim": dim, "ids": self._ids,
+                       "texts": self._texts, "metadatas": self._metadatas}, f)
+        for name in list(arrays) + ["documents.json"]:
+            os.replace(os.path.join(path, name + ".tmp"), os.path.join(path, name))
+
+    @classmethod
+    def load(cls, path, embedding):
+        """
+        Opens a store written by `save`, memory-mapping the vector matrix so only
+        the pages a search touches are read. Returns an empty store if `path` has
+        no saved index.
+        """
+        try:
+            with open(os.path.join(path, "documents.json"), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return cls(embedding, path=path)
+        store = cls(embedding, dtype=saved["dtype"], path=path)
+        store._ids = saved["ids"]
+        store._texts = saved["texts"]
+        store._metadatas = saved["metadatas"]
+        store._size = len(store._ids)
+        store._rows = {doc_id: row for row, doc_id in enumerate(store._ids)}
+        if store._size:
+            store._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            store._scales = np.load(os.path.join(path, "scales.npy"))
+        store._alive = np.ones(store._size, dtype=bool)
+        return store
+
+
+if __name__ == "__main__":
+    import gc
+    import resource
+    import shutil
+    import sys
+    import tempfile
+    import time
+
+    from fakes import FakeEmbeddings
+
+    # Insert and query latency and memory at growing sizes, against Chroma when
+    # it is installed. Sizes can be given as arguments, e.g. `10000 100000 1000000`.
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    dim, queries, k, batch = 256, 100, 50, 5000
+    rng = np.random.default_rng(0)
+    embeddings = FakeEmbeddings(size=dim)
+    query_vectors = rng.standard_normal((queries, dim)).astype(np.float32)
+
+    def rss_mb():
+        # ru_maxrss is the peak RSS in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    for size in sizes:
+        vectors = rng.standard_normal((size, dim)).astype(np.float32)
+        texts = [f"chunk {i}" for i in range(size)]
+        ids = [str(i) for i in range(size)]
+
+        for dtype in ("float32", "float16", "int8"):
+            store = NumpyVectorStore(embeddings, dtype=dtype)
+            start = time.perf_counter()
+            for offset in range(0, size, batch):
+                store.add_embeddings(texts[offset:offset + batch], vectors[offset:offset + batch],
+                                     ids=ids[offset:offset + batch])
+            insert = time.perf_counter() - start
+            start = time.perf_counter()
+            for vector in query_vectors:
+                store.similarity_search_by_vector(vector, k)
+            single = (time.perf_counter() - start) / queries
+            start = time.perf_counter()
+            store.top_k(query_vectors, k)
+            batched = (time.perf_counter() - start) / queries
+            print(f"[⏱️] numpy {dtype:>7} n={size:>8}: insert {insert:7.2f}s, query {single * 1000:7.2f} ms "
+                  f"({batched * 1000:6.2f} ms batched), vectors {store.memory_bytes() / 2**20:8.1f} MiB")
+            del store
+            gc.collect()
+
+        try:
+            import chromadb
+        except ImportError:
+            print("[⚠️] chromadb is not installed, skipping the Chroma comparison")
+            continue
+        directory = tempfile.mkdtemp()
+        rss_before = rss_mb()
+        collection = chromadb.PersistentClient(path=directory).create_collection(
+            "bench", metadata={"hnsw:space": "cosine"}
+        )
+        start = time.perf_counter()
+        for offset in range(0, size, batch):
+            collection.add(ids=ids[offset:offset + batch], embeddings=vectors[offset:offset + batch].tolist(),
+                           documents=texts[offset:offset + batch])
+        insert = time.perf_counter() - start
+        start = time.perf_counter()
+        for vector in query_vectors:
+            collection.query(query_embeddings=[vector.tolist()], n_results=k)
+        single = (time.perf_counter() - start) / queries
+        print(f"[⏱️] chroma          n={size:>8}: insert {insert:7.2f}s, query {single * 1000:7.2f} ms, "
+              f"peak RSS +{rss_mb() - rss_before:8.1f} MiB")
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,252 @@
+import asyncio
+import concurrent.futures
+import logging
+import math
+import os
+import time
+
+from archi_diagram import generate_diagram_from_graph
+from dep_graph import build_graph
+from files import scan_subfolders
+from journal import RunJournal
+from llm_cache import enable_llm_cache
+from llm_engine import LLMScheduler, RateLimiter
+from metrics import configure_logging, metrics, run_recorded
+from models import get_embeddings, get_model
+from indexing import collection_name_for, open_manifest, open_vector_store, plan_index, finish_index, record_ids
+from rag_test import add_documents_in_batches
+from readme_generation import generate_readme_with_rag
+from const import paths
+
+logger = logging.getLogger(__name__)
+
+output_directory = "./outputs"
+
+# Scans and dependency graphs built in the worker pool, by repository path
+prepared_files = {}
+prepared_graphs = {}
+
+# Artifact name -> generator(path, vector_store, model, idx). Generators only read
+# the index (or the files), so any number of them can run against the same
+# collection at once. Coroutine functions are awaited on the event loop and get
+# the shared `scheduler` and the run `journal`; plain functions run in a thread.
+# A generator that returns its output path is journaled as one unit.
+generators = {
+    "readme": lambda path, vector_store, model, idx: generate_readme_with_rag(
+        vector_store, model, idx, output_path=os.path.join(output_dir_for(path), "README.md")
+    ),
+    "diagram": lambda path, vector_store, model, idx: generate_diagram_from_graph(
+        path, model, idx, graph=prepared_graphs.get(path), files=prepared_files.get(path),
+        output_path=os.path.join(output_dir_for(path), "architecture.md"),
+    ),
+}
+default_artifacts = ("readme", "diagram")
+
+
+async def _document_repository(path, vector_store, model, idx, scheduler=None, journal=None):
+    from inline_docs import document_repository
+
+    # Journaled file by file, so a resumed run only redoes the missing files
+    report = await document_repository(path, model, scheduler, journal, prepared_files.get(path))
+    if report["failed_files"]:
+        raise RuntimeError(f"{len(report['failed_files'])} files not documented")
+
+
+generators["docs"] = _document_repository
+
+
+def register_generator(name, generator):
+    """
+    Plugs another artifact generator into the pipeline.
+    """
+    generators[name] = generator
+
+
+def output_dir_for(path):
+    """
+    Per-repository output directory, named like the repository's collection.
+    """
+    return os.path.join(output_directory, collection_name_for(path))
+
+
+async def run_repository(path, idx, embeddings, model, artifacts=None, pool=None,
+                         llm_scheduler=None, embedding_scheduler=None, batch_size=256, journal=None):
+    """
+    Indexes the repository at `path` once, then runs the selected generators
+    concurrently against the same collection. Returns {artifact: error or None}.
+
+    With a process `pool`, scanning, reading, chunking, dedupe and the
+    dependency graph run in worker processes. Embedding batches and LLM calls go
+    through the given schedulers, which can be shared between repositories so
+    that all of them stay within one set of API limits.
+
+    Artifacts that `journal` records as done, with intact outputs, are skipped.
+    """
+    start = time.time()
+    llm_scheduler = llm_scheduler or LLMScheduler()
+    embedding_scheduler = embedding_scheduler or LLMScheduler(name="embedding")
+    names = list(artifacts or default_artifacts)
+    if journal is not None:
+        skipped = [name for name in names if journal.is_done(path, name)]
+        if skipped:
+            logger.info("[⏭️] %s already generated for %s", ", ".join(skipped), path)
+        names = [name for name in names if name not in skipped]
+        if not names:
+            return {}
+    vector_store = open_vector_store(path, embeddings)
+    with metrics.span("index", repo=path):
+        stats = await index_in_pool(vector_store, path, pool, embedding_scheduler, batch_size, with_graph="diagram" in names)
+    logger.info("[🗂️] Index ready in %.2fs (fingerprint %s)", time.time() - start, stats["fingerprint"][:12])
+
+    results = await asyncio.gather(
+        *(run_artifact(name, path, vector_store, model, idx, llm_scheduler, journal) for name in names),
+        return_exceptions=True,
+    )
+    prepared_graphs.pop(path, None)
+    prepared_files.pop(path, None)
+    outcome = {}
+    for name, result in zip(names, results):
+        outcome[name] = result if isinstance(result, Exception) else None
+        if outcome[name] is not None:
+            logger.error("[❌] %s failed for %s: %s", name, path, result)
+    logger.info("[🎉] %s for %s done in %.2fs", ", ".join(names), path, time.time() - start)
+    return outcome
+
+
+async def run_artifact(name, path, vector_store, model, idx, scheduler, journal=None):
+    """
+    Runs the generator of artifact `name` for one repository, through
+    `scheduler`, and journals its output path.
+    """
+    generator = generators[name]
+    with metrics.span("artifact", repo=path, artifact=name):
+        if asyncio.iscoroutinefunction(generator):
+            output = await generator(path, vector_store, model, idx, scheduler=scheduler, journal=journal)
+        else:
+            # One LLM request, charged as a full context against the shared limits
+            output = await scheduler.run(lambda: asyncio.to_thread(generator, path, vector_store, model, idx), 8000)
+    if journal is not None and isinstance(output, str):
+        journal.record(path, name, output=output)
+    return output
+
+
+async def run_in_pool(pool, fn, *args):
+    """
+    `loop.run_in_executor(pool, fn, *args)` that brings the metrics recorded by
+    `fn` in a worker process back into this process's `metrics`.
+    """
+    result, recorded = await asyncio.get_running_loop().run_in_executor(pool, run_recorded, fn, *args)
+    if recorded is not None:
+        metrics.merge(recorded)
+    return result
+
+
+async def index_in_pool(vector_store, path, pool, scheduler, batch_size=256, with_graph=False):
+    """
+    `indexing.index_repository` split across processes: the scan, `plan_index`
+    and the dependency graph run in `pool`, while embedding batches are added
+    here, each one through `scheduler`. Without a pool these run in a thread.
+    The scan is kept for the generators in `prepared_files`.
+    """
+    manifest = open_manifest(vector_store, path)
+    files = prepared_files[path] = await run_in_pool(pool, scan_subfolders, path)
+    graph = None
+    if with_graph:
+        # Parsed file by file inside the worker; the pool already runs repositories in parallel
+        graph = asyncio.ensure_future(run_in_pool(pool, build_graph, path, 2, None, math.inf, files))
+    try:
+        plan = await run_in_pool(pool, plan_index, path, manifest, True, files)
+    except BaseException:
+        if graph is not None:
+            graph.cancel()
+        raise
+    manifest, stats = plan["manifest"], plan["stats"]
+
+    if plan["deleted"]:
+        await asyncio.to_thread(vector_store.delete, ids=plan["deleted"])
+    on_added = record_ids(manifest)
+    chunks, rows = plan["chunks"], plan["rows"]
+
+    def add_rows(batch_rows):
+        # Chunk text only exists while its batch is in flight
+        batch = chunks.documents(batch_rows)
+        return add_documents_in_batches(vector_store, batch, len(batch), on_added)
+
+    async def add(batch_rows):
+        # About 4 bytes per token, so the text is not decoded before the batch is admitted
+        tokens = chunks.byte_size(batch_rows) // 4
+        # Re-adding a batch after a failure is safe: IDs are content-derived, so it is an upsert
+        stats["chunks"] += await scheduler.run(lambda: asyncio.to_thread(add_rows, batch_rows), tokens)
+
+    try:
+        await asyncio.gather(*(add(rows[i:i + batch_size]) for i in range(0, len(rows), batch_size)))
+    finally:
+        chunks.close()
+    stats = await asyncio.to_thread(finish_index, vector_store, path, manifest, stats, plan["deduplicator"], batch_size)
+    if graph is not None:
+        try:
+            prepared_graphs[path] = await graph
+        except Exception as e:
+            # The diagram generator builds the graph itself when none was prepared
+            logger.warning("[⚠️] Dependency graph of %s failed in the worker: %r", path, e)
+    return stats
+
+
+async def run_repositories(repo_paths, embeddings, model, artifacts=None, max_workers=None,
+                           llm_concurrency=8, requests_per_minute=3500, tokens_per_minute=90_000,
+                           embedding_concurrency=4, embedding_requests_per_minute=3000,
+                           embedding_tokens_per_minute=1_000_000, journal=None):
+    """
+    Runs every repository concurrently: CPU and disk stages share one process
+    pool, and all LLM calls and embedding batches share one scheduler each, so
+    the API limits hold for the whole batch. Repositories are isolated: an error
+    in one is reported and the others carry on. Returns {path: outcome}, where
+    outcome maps artifacts to errors (or None), or is the exception that stopped
+    the repository.
+    """
+    llm_scheduler = LLMScheduler(llm_concurrency, RateLimiter(requests_per_minute, tokens_per_minute))
+    embedding_scheduler = LLMScheduler(
+        embedding_concurrency, RateLimiter(embedding_requests_per_minute, embedding_tokens_per_minute), name="embedding"
+    )
+    start = time.time()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        results = await asyncio.gather(
+            *(run_repository(path, idx, embeddings, model, artifacts, pool, llm_scheduler, embedding_scheduler,
+                             journal=journal)
+              for idx, path in enumerate(repo_paths)),
+            return_exceptions=True,
+        )
+
+    outcomes = dict(zip(repo_paths, results))
+    for path, outcome in outcomes.items():
+        if isinstance(outcome, Exception):
+            logger.error("[❌] %s failed: %r", path, outcome)
+        else:
+            failed = [name for name, error in outcome.items() if error is not None]
+            if failed:
+                logger.warning("[⚠️] %s: %s failed", path, ", ".join(failed))
+            else:
+                logger.info("[✅] %s: done", path)
+    logger.info("[🤖] LLM calls:\n%s", llm_scheduler.summary())
+    logger.info("[🧠] Embedding batches:\n%s", embedding_scheduler.summary())
+    logger.info("[🎉] %d repositories in %.2fs", len(repo_paths), time.time() - start)
+    return outcomes
+
+
+if __name__ == "__main__":
+    import sys
+
+    configure_logging()
+    embeddings = get_embeddings()
+    llm_cache = enable_llm_cache()
+
+    # Optional artifact names as arguments, e.g. `python pipeline.py readme diagram docs`;
+    # --resume skips the artifacts and files a previous, interrupted run completed
+    artifacts = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    with RunJournal("pipeline", resume="--resume" in sys.argv) as journal:
+        asyncio.run(run_repositories(paths, embeddings, get_model(), artifacts or None, journal=journal))
+
+    logger.info("[💾] Embedding cache: %s", embeddings.stats())
+    if llm_cache is not None:
+        logger.info(llm_cache.summary())
+    metrics.export()
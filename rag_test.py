@@ -1,46 +1,113 @@
+import hashlib
+import logging
 import os
 from pathlib import Path
-from uuid import uuid4
 
 
-from dotenv import load_dotenv
-from langchain.chat_models import ChatOpenAI
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
+from chunking import chunk_code
+from dedupe import ChunkDeduplicator
+from metrics import metrics
 
-model = ChatOpenAI(openai_api_key=api_key)
+logger = logging.getLogger(__name__)
 
-def read_all_file_contents(read_files, chunk_size=500, chunk_overlap=75):
+def read_all_file_contents(read_files, chunk_size=500, chunk_overlap=75, splitter="code", max_tokens=512, dedupe=True):
     """
     Convert the files into LangChain Document objects.
+    `read_files` can be a list or a stream of records such as `files.iter_contents`.
+    With `dedupe`, exact and near-duplicate chunks are dropped and listed in the
+    "aliases" metadata of the chunk that is kept.
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", " ", ""],  # try to split cleanly: paragraphs > lines > words > chars
-    )
-    documents = []
+    with metrics.span("chunk"):
+        documents = iter_documents(read_files, chunk_size, chunk_overlap, splitter, max_tokens)
+        if dedupe:
+            deduplicator = ChunkDeduplicator(key=document_id)
+            documents = list(deduplicator.filter(documents))
+            for doc in documents:
+                doc.metadata.update(deduplicator.aliases_metadata(document_id(doc)))
+            logger.info(deduplicator.summary())
+        documents = list(documents)
+    uuids = [document_id(doc) for doc in documents]
+    return documents, uuids
+
+
+def document_id(doc):
+    """
+    Stable, content-derived vector store ID: the same chunk of the same file
+    always gets the same ID across runs.
+    """
+    key = f"{doc.metadata['source']}\0{doc.metadata['file_chunk_id']}\0{doc.page_content}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def iter_documents(read_files, chunk_size=500, chunk_overlap=75, splitter="code", max_tokens=512):
+    """
+    Yields the Documents of each file as soon as its record arrives.
+
+    With splitter="code" files are split at module/class/function boundaries by
+    `chunking.chunk_code`, up to `max_tokens` per chunk, and each chunk carries its
+    symbol, kind and line range. splitter="character" keeps the old
+    `chunk_size`/`chunk_overlap` character splitter.
+    """
+    text_splitter = None
+    if splitter == "character":
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=["\n\n", "\n", " ", ""],  # try to split cleanly: paragraphs > lines > words > chars
+        )
     id = 0
     for file in read_files:
-        chunks = text_splitter.split_text(file["contents"])
+        if text_splitter is not None:
+            chunks = [{"text": chunk} for chunk in text_splitter.split_text(file["contents"])]
+        else:
+            chunks = chunk_code(file["contents"], file["extension"], max_tokens)
+        metrics.count("chunks_total", len(chunks), splitter=splitter)
         # chunks = chunk_content(file["contents"], chunk_size)
         for idx, chunk in enumerate(chunks):
-            new_doc = Document(
-                page_content=chunk,
-                metadata={
-                    "source": file["filePath"],
-                    "extension": file["extension"],
-                    "file_chunk_id": idx,
-                    "id": id,
-                },
-            )
+            metadata = {
+                "source": file["filePath"],
+                "extension": file["extension"],
+                "file_chunk_id": idx,
+                "id": id,
+            }
+            for key in ("symbol", "kind", "start_line", "end_line"):
+                if key in chunk:
+                    metadata[key] = chunk[key]
+            yield Document(page_content=chunk["text"], metadata=metadata)
             id += 1
-            documents.append(new_doc)
-    uuids = [str(uuid4()) for _ in range(len(documents))]
-    return documents, uuids
+
+
+def add_documents_in_batches(vector_store, documents, batch_size=256, on_added=None):
+    """
+    Adds a stream of Documents to the vector store in batches, so embedding starts
+    while files are still being read. Documents are stored under `document_id`, and
+    `on_added(documents, ids)` is called after each batch. Returns the number of
+    documents added.
+    """
+    batch = []
+    total = 0
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            total += _add_batch(vector_store, batch, on_added)
+            batch = []
+    if batch:
+        total += _add_batch(vector_store, batch, on_added)
+    return total
+
+
+def _add_batch(vector_store, batch, on_added):
+    ids = [document_id(doc) for doc in batch]
+    with metrics.span("embed"):
+        vector_store.add_documents(batch, ids=ids)
+    metrics.count("chunks_embedded_total", len(batch))
+    if on_added is not None:
+        on_added(batch, ids)
+    return len(batch)
 
 # def chunk_content(content, chunk_size=1000):
 #     """Split content into chunks of chunk_size characters."""
@@ -1,124 +1,132 @@
-import os
+import asyncio
+import logging
+import sys
 
-from dotenv import load_dotenv
-from langchain.chat_models import ChatOpenAI
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
 from langchain.prompts.chat import ChatPromptTemplate
 
-from files import scan_subfolders, read_contents
-from rag_test import read_all_file_contents
+from context_builder import retrieve_context
+from indexing import open_vector_store, index_repository
+from journal import RunJournal, atomic_write
+from llm_cache import enable_llm_cache
+from metrics import configure_logging, metrics
+from models import get_embeddings, get_model, summary_model_name
+import streaming
+from summary_tree import summarize_repository
 from const import paths
 
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
 
-model = ChatOpenAI(openai_api_key=api_key)
+readme_prompt = ChatPromptTemplate.from_messages([
+    ("system",
+        """
+        You are an expert software engineer who writes clean, production-ready README.md files for codebases.
 
-def generate_readme_with_rag(vector_store, model,idx):
-    print("[📚] Retrieving all content from vector DB for summarization...")
+        Your task:
+        - Only generate a professional README.md file.
+        - Only use clean and valid markdown formatting.
+        - Strictly include the following sections, in this order:
+        1. **Project Description** – Explain what the project does and its purpose.
+        2. **Tech Stack** – List the programming languages, libraries, and frameworks used.
+        3. **Environment Variables** – Mention any environment variables required (e.g., API keys, DB configs).
+        4. **Setup Instructions** – Include steps to install dependencies and set up the environment.
+        5. **Running Instructions** – Provide commands or steps to run the project locally or in production.
 
-    results = vector_store.similarity_search(
-        query="Summarize the purpose, technologies, environment setup, and running instructions of the entire project.",
-        k=50
+        Important Rules:
+        - Do NOT generate any Mermaid diagrams.
+        - Do NOT generate architecture diagrams.
+        - Do NOT add extra sections beyond the 5 listed.
+        - Do NOT explain your reasoning.
+        - Do NOT add comments, tips, or additional markdown outside the 5 sections.
+        - Focus on being concise but informative.
+        - Only output pure markdown content for the README.md file.
+
+        """
+    ),
+    (
+        "user", 
+        """Given the following codebase context:
+
+        {context}
+        """
     )
-    
-    # Filter relevant files
-    key_extensions = {
-        ".py",
-        ".js",
-        ".ts",
-        ".java",
-        ".cs",
-        ".cpp",
-        ".c",
-        ".go",
-        ".rb",
-        ".php",
-        ".rs",
-        ".kt",
-        ".swift",
-        ".scala",
-        ".sh",
-        ".pl",
-        ".dart",
-        ".html",
-        ".css",
-        ".json",
-        ".xml",
-        ".yml",
-        ".yaml",
-        ".sql",
-        ".jsx",
-        ".tsx",
-    }
-    
-    filtered_docs = []
-    for doc in results:
-        metadata = doc.metadata
-        ext = metadata.get("extension", "").lower()
-        if ext and (ext.startswith(".") and ext in key_extensions) or (f".{ext}" in key_extensions):
-            filtered_docs.append(doc.page_content)
-
-    full_context = "\n".join(filtered_docs)
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system",
-            """
-            You are an expert software engineer who writes clean, production-ready README.md files for codebases.
-            
-            Your task:
-            - Only generate a professional README.md file.
-            - Only use clean and valid markdown formatting.
-            - Strictly include the following sections, in this order:
-            1. **Project Description** – Explain what the project does and its purpose.
-            2. **Tech Stack** – List the programming languages, libraries, and frameworks used.
-            3. **Environment Variables** – Mention any environment variables required (e.g., API keys, DB configs).
-            4. **Setup Instructions** – Include steps to install dependencies and set up the environment.
-            5. **Running Instructions** – Provide commands or steps to run the project locally or in production.
-
-            Important Rules:
-            - Do NOT generate any Mermaid diagrams.
-            - Do NOT generate architecture diagrams.
-            - Do NOT add extra sections beyond the 5 listed.
-            - Do NOT explain your reasoning.
-            - Do NOT add comments, tips, or additional markdown outside the 5 sections.
-            - Focus on being concise but informative.
-            - Only output pure markdown content for the README.md file.
-
-            """
-        ),
-        (
-            "user", 
-            """Given the following codebase context:
-            
-            {context}
-            """
+])
+
+
+def generate_readme_with_rag(vector_store, model,idx, max_tokens=8000, use_mmr=False, output_path=None):
+    logger.info("[📚] Retrieving all content from vector DB for summarization...")
+
+    with metrics.span("retrieve"):
+        full_context = retrieve_context(
+            vector_store,
+            query="Summarize the purpose, technologies, environment setup, and running instructions of the entire project.",
+            model=model,
+            k=50,
+            max_tokens=max_tokens,
+            use_mmr=use_mmr,
         )
-    ])
 
+    return write_readme(model, full_context, idx, output_path)
+
+
+def write_readme(model, context, idx, output_path=None, stream=None):
+    """
+    Generates the README from `context` and writes it. With `stream` (default:
+    `streaming.stream_outputs`) the response is streamed to the file as it is
+    generated.
+    """
+    output_path = output_path or f"testing_readmes/testing_README_{str(idx)}.md"
+    if streaming.stream_outputs if stream is None else stream:
+        with metrics.span("readme"):
+            streaming.stream_to_file(readme_prompt, model, {"context": context}, output_path)
+        logger.info("[✅] README.md streamed to %s", output_path)
+        return output_path
 
-    chain = prompt | model
-    readme = chain.invoke({"context": full_context}).content
-    with open(f"testing_readmes/testing_README_{str(idx)}.md", "w") as f:
-        f.write(readme)
-    print("[✅] README.md generated successfully with summarization.")
+    chain = readme_prompt | model
+    with metrics.span("readme"):
+        readme = chain.invoke({"context": context}).content
+    atomic_write(output_path, readme)
+    logger.info("[✅] README.md generated successfully with summarization.")
+    return output_path
+
+
+def generate_readme_with_summary_tree(path, model, idx, summary_model=None, output_path=None, files=None):
+    """
+    Writes the README from a bottom-up summary tree of the whole repository
+    instead of the top 50 retrieved chunks. Files are summarized with the cheaper
+    `summary_model`, then directories from their children's summaries.
+    """
+    logger.info("[🌳] Summarizing repository bottom-up...")
+    with metrics.span("summary_tree"):
+        context = asyncio.run(summarize_repository(path, summary_model or model, files=files))
+    return write_readme(model, context, idx, output_path)
 
 if __name__ == "__main__":
-    print("[🔍] Scanning files...")
-    print(paths)
-
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-    vector_store = Chroma(
-        collection_name="codebase_name",
-        embedding_function=embeddings,
-        persist_directory="./vector_db",
-    )
+    configure_logging()
+    logger.info("[🔍] Scanning files...")
+    logger.info(paths)
+
+    model = get_model()
+    embeddings = get_embeddings()
+    llm_cache = enable_llm_cache()
+
+    # --resume skips repositories whose README a previous, interrupted run wrote
+    journal = RunJournal("readme", resume="--resume" in sys.argv)
 
     for idx in range(len(paths)):
-        vector_store.reset_collection()
-        resultant_files = scan_subfolders(path=paths[idx])
-        read_files = read_contents(resultant_files)
-        documents, uuids = read_all_file_contents(read_files)
-        vector_store.add_documents(documents)
-        generate_readme_with_rag(vector_store, model,idx)
+        if journal.is_done(paths[idx], "readme"):
+            logger.info("[⏭️] README already generated for %s", paths[idx])
+            continue
+        with metrics.span("repository", repo=paths[idx]):
+            if "--summary-tree" in sys.argv:
+                output = generate_readme_with_summary_tree(paths[idx], model, idx, get_model(summary_model_name))
+            else:
+                vector_store = open_vector_store(paths[idx], embeddings)
+                index_repository(vector_store, paths[idx])
+                output = generate_readme_with_rag(vector_store, model,idx)
+        journal.record(paths[idx], "readme", output=output)
+    journal.close()
+
+    logger.info("[💾] Embedding cache: %s", embeddings.stats())
+    if llm_cache is not None:
+        logger.info(llm_cache.summary())
+    metrics.export()
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import re
+import time
+
+from journal import atomic_open, atomic_write
+from llm_cache import is_cached
+from llm_engine import LLMScheduler
+from metrics import metrics
+from tokens import count_tokens, model_name_of
+
+logger = logging.getLogger(__name__)
+
+# Default for the generators' `stream` argument (STREAM_OUTPUTS=1 or --stream)
+stream_outputs = os.getenv("STREAM_OUTPUTS", "0") == "1"
+
+# finish_reason values of a response that was cut short
+truncated_finish_reasons = {"length", "max_tokens", "content_filter"}
+
+
+class StreamTruncated(Exception):
+    """
+    A streamed response ended before the model finished it: it hit the token
+    limit or a content filter, or no content arrived at all. Retryable, like a
+    dropped connection.
+    """
+
+
+class StripFilter:
+    """
+    `str.strip()` applied to a stream of text pieces: leading whitespace is
+    dropped, and trailing whitespace is held back until more text arrives or
+    the stream ends.
+    """
+
+    _tail_pattern = re.compile(r"\s*$")
+
+    def __init__(self):
+        self._head = ""
+        self._started = False
+        self._tail = ""
+
+    def _strip_head(self, text):
+        """
+        The start of the output once `text` is enough to decide it, else None.
+        """
+        return text.lstrip() or None
+
+    def _strip_tail(self, tail):
+        return ""
+
+    def clean(self, text):
+        return text.strip()
+
+    def feed(self, text):
+        """
+        Takes the next piece of the response and returns the text that can be
+        written now.
+        """
+        if not self._started:
+            self._head += text
+            head = self._strip_head(self._head)
+            if head is None:
+                return ""
+            self._started, self._head, text = True, "", head
+        text = self._tail + text
+        cut = self._tail_pattern.search(text).start()
+        self._tail = text[cut:]
+        return text[:cut]
+
+    def finish(self):
+        """
+        The rest of the output, once the stream is over.
+        """
+        if not self._started:
+            return self.clean(self._head)
+        return self._strip_tail(self._tail)
+
+
+def _message_text(messages):
+    return "\n".join(message.content for message in messages if isinstance(message.content, str))
+
+
+async def astream_to_file(prompt, model, inputs, path, stream_filter=None):
+    """
+    Streams the response of `model` to `prompt` formatted with `inputs` into
+    `path`. Pieces are written as they arrive, through a new `stream_filter`
+    (a class such as StripFilter), to a temporary file that replaces `path`
+    only once the stream completes. A dropped connection or a StreamTruncated
+    response leaves `path` as it was. Records the time to first token and the
+    tokens per second.
+
+    A response already in the LLM cache is read from it instead: streaming
+    bypasses the cache. Streamed responses are not added to it.
+    """
+    messages = prompt.format_messages(**inputs)
+    name = model_name_of(model)
+    stream_filter = stream_filter() if stream_filter is not None else None
+    if is_cached(model, messages):
+        response = await model.ainvoke(messages)
+        text = response.content
+        if stream_filter is not None:
+            text = stream_filter.feed(text) + stream_filter.finish()
+        await asyncio.to_thread(atomic_write, path, text)
+        return path
+
+    start = time.perf_counter()
+    first_token = None
+    tokens = 0
+    finish_reason = None
+    with atomic_open(path) as f:
+        # Tagged so the usage callback leaves the (estimated) usage to us
+        async for chunk in model.astream(messages, config={"tags": ["stream"]}):
+            finish_reason = (getattr(chunk, "response_metadata", None) or {}).get("finish_reason") or finish_reason
+            text = chunk.content if isinstance(chunk.content, str) else ""
+            if not text:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter()
+                metrics.observe("llm_ttft_seconds", first_token - start, model=name)
+            tokens += count_tokens(text, name)
+            if stream_filter is not None:
+                text = stream_filter.feed(text)
+            f.write(text)
+        if first_token is None or finish_reason in truncated_finish_reasons:
+            metrics.count("llm_stream_truncations_total", model=name, reason=finish_reason or "empty")
+            raise StreamTruncated(f"stream for {path} ended early (finish_reason={finish_reason})")
+        if stream_filter is not None:
+            f.write(stream_filter.finish())
+
+    elapsed = time.perf_counter() - first_token
+    if elapsed > 0:
+        metrics.observe("llm_tokens_per_second", tokens / elapsed, model=name)
+    metrics.record_usage(name, count_tokens(_message_text(messages), name), tokens)
+    logger.debug("[🌊] %s: first token after %.2fs, %d tokens at %.1f tokens/s",
+                 path, first_token - start, tokens, tokens / elapsed if elapsed > 0 else 0.0)
+    return path
+
+
+def stream_to_file(prompt, model, inputs, path, stream_filter=None, max_retries=2):
+    """
+    Blocking `astream_to_file` for the synchronous generators, retrying
+    truncated streams and dropped connections.
+    """
+    scheduler = LLMScheduler(1, max_retries=max_retries, name="stream")
+    return asyncio.run(scheduler.run(lambda: astream_to_file(prompt, model, inputs, path, stream_filter)))
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import logging
+import os
+import posixpath
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from disk_cache import DiskCache
+from files import scan_subfolders, iter_contents
+from llm_engine import LLMScheduler, RateLimiter
+from metrics import metrics
+from templates import directory_summary_template, file_summary_template
+from tokens import count_tokens, model_name_of
+
+logger = logging.getLogger(__name__)
+
+summary_cache_path = "./cache/summaries.sqlite"
+# Bump when the summary prompts change so old summaries are not reused
+summary_version = "1"
+
+
+def _node_key(model_name, *parts):
+    digest = hashlib.sha256()
+    for part in (summary_version, model_name) + parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _truncate(text, max_tokens):
+    # Cheap character cut first, exact count only for the borderline case
+    if len(text) <= max_tokens * 2 or count_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4] + "\n... (truncated)"
+
+
+def _excerpt(text, max_lines=8, max_chars=400):
+    """
+    Stand-in for a file summary that could not be generated: its first lines.
+    """
+    excerpt = "\n".join(text.strip().splitlines()[:max_lines])[:max_chars]
+    return f"(summary unavailable) starts with:\n{excerpt}" if excerpt else "(summary unavailable)"
+
+
+async def summarize_repository(path, llm, cache=None, max_concurrency=8, requests_per_minute=3500,
+                               tokens_per_minute=200_000, max_file_tokens=4000, max_children_tokens=6000,
+                               files=None):
+    """
+    Builds a summary tree of the repository at `path` and returns the context for
+    the README prompt: the root summary followed by its direct children.
+
+    Every file is summarized from its contents and every directory from its
+    children's summaries. All nodes of one level run concurrently (bounded by
+    `max_concurrency`), from the deepest directories up to the root. Each node
+    is cached under a hash of its content (for files) or of its children's keys
+    (for directories). A re-run therefore only recomputes changed files and the
+    directories between them and the root. `files` can pass in the result of
+    `scan_subfolders(path)`.
+
+    A node whose summary fails is logged and replaced by a placeholder (an
+    excerpt, for a file), so one bad file does not cost the whole README.
+    Placeholders and the directories above them are not cached.
+    """
+    cache = cache if cache is not None else DiskCache(summary_cache_path)
+    model_name = model_name_of(llm)
+    scheduler = LLMScheduler(max_concurrency, RateLimiter(requests_per_minute, tokens_per_minute))
+    file_chain = ChatPromptTemplate.from_template(file_summary_template) | llm | StrOutputParser()
+    dir_chain = ChatPromptTemplate.from_template(directory_summary_template) | llm | StrOutputParser()
+    root = os.path.realpath(path)
+    dirs = set()
+
+    # Directory -> list of (name, is_dir, key); "" is the repository root.
+    # Sub-directory entries carry their own path and get their key once summarized
+    children = {"": []}
+    summaries = {}
+    pending_files = []
+    for record in iter_contents(scan_subfolders(path) if files is None else files):
+        rel_path = os.path.relpath(record["filePath"], root).replace(os.sep, "/")
+        key = _node_key(model_name, "file", rel_path, record["contents"])
+        parent = posixpath.dirname(rel_path)
+        children.setdefault(parent, []).append((posixpath.basename(rel_path), False, key))
+        while parent and parent not in dirs:
+            dirs.add(parent)
+            children.setdefault(parent, [])
+            children.setdefault(posixpath.dirname(parent), [])
+            parent = posixpath.dirname(parent)
+        pending_files.append((key, rel_path, record))
+    if not pending_files:
+        return "Repository overview: the repository has no source files."
+    for rel_dir in dirs:
+        children[posixpath.dirname(rel_dir)].append((posixpath.basename(rel_dir), True, rel_dir))
+
+    cached = cache.get_many([key for key, _, _ in pending_files])
+    summaries.update({key: value.decode("utf-8") for key, value in cached.items()})
+
+    async def summarize_file(key, rel_path, record):
+        inputs = {"language": record["extension"], "path": rel_path,
+                  "code": _truncate(record["contents"], max_file_tokens)}
+        tokens = count_tokens(inputs["code"]) + 200
+        summaries[key] = (await scheduler.run(lambda: file_chain.ainvoke(inputs), tokens)).strip()
+        cache.set(key, summaries[key].encode("utf-8"))
+
+    misses = [entry for entry in pending_files if entry[0] not in summaries]
+    logger.info("[🌳] %d files, %d to summarize", len(pending_files), len(misses))
+    # Keys of placeholder summaries, which must not reach the cache
+    degraded = set()
+    results = await asyncio.gather(*(summarize_file(*entry) for entry in misses), return_exceptions=True)
+    for (key, rel_path, record), result in zip(misses, results):
+        if isinstance(result, Exception):
+            metrics.count("summaries_failed_total", node="file")
+            logger.warning("[⚠️] Could not summarize %s, using an excerpt: %s", rel_path, result)
+            summaries[key] = _excerpt(record["contents"])
+            degraded.add(key)
+
+    # Summarize directories bottom-up, one depth level at a time
+    dir_keys = {}
+    depth_of = lambda rel_dir: rel_dir.count("/") + 1 if rel_dir else 0
+    for depth in sorted({depth_of(d) for d in children}, reverse=True):
+        level = [d for d in children if depth_of(d) == depth]
+
+        async def summarize_dir(rel_dir):
+            entries = sorted(children[rel_dir])
+            child_keys = [dir_keys[key] if is_dir else key for _, is_dir, key in entries]
+            dir_keys[rel_dir] = key = _node_key(model_name, "dir", rel_dir, *child_keys)
+            if degraded.intersection(child_keys):
+                degraded.add(key)
+            cached = cache.get(key)
+            if cached is not None:
+                summaries[key] = cached.decode("utf-8")
+                return
+            lines = [
+                f"- {name}{'/' if is_dir else ''}: {summaries.get(child_key, '')}"
+                for (name, is_dir, _), child_key in zip(entries, child_keys)
+            ]
+            inputs = {"path": rel_dir or ".", "children": _truncate("\n".join(lines), max_children_tokens)}
+            tokens = count_tokens(inputs["children"]) + 200
+            summaries[key] = (await scheduler.run(lambda: dir_chain.ainvoke(inputs), tokens)).strip()
+            if key not in degraded:
+                cache.set(key, summaries[key].encode("utf-8"))
+
+        results = await asyncio.gather(*(summarize_dir(d) for d in level), return_exceptions=True)
+        for rel_dir, result in zip(level, results):
+            if isinstance(result, Exception):
+                metrics.count("summaries_failed_total", node="dir")
+                logger.warning("[⚠️] Could not summarize %s/, listing its entries instead: %s", rel_dir or ".", result)
+                key = dir_keys[rel_dir]
+                names = ", ".join(f"{name}{'/' if is_dir else ''}" for name, is_dir, _ in sorted(children[rel_dir]))
+                summaries[key] = f"(summary unavailable) contains: {names}"
+                degraded.add(key)
+
+    logger.info(scheduler.summary())
+    root_entries = sorted(children[""])
+    context = [f"Repository overview: {summaries[dir_keys['']]}", ""]
+    for name, is_dir, key in root_entries:
+        summary = summaries.get(dir_keys[key] if is_dir else key, "")
+        context.append(f"- {name}{'/' if is_dir else ''}: {summary}")
+    return "\n".join(context)
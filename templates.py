@@ -28,4 +28,28 @@ Your goal is to enhance code readability with inline documentation — and **not
 '''
 
 
-user_template = "Language:{language} \n {code}"
\ No newline at end of file
+user_template = "Language:{language} \n {code}"
+
+segment_template = """This is part {part} of {parts} of a larger file. The other parts are documented separately, so document only this part and return all of it, keeping its original indentation.
+
+File overview:
+{preamble}
+
+Language:{language} 
+ {code}"""
+
+
+batch_template = """The following {count} files are each wrapped between a <<<FILE n: name (language)>>> line and a <<<END FILE n>>> line. Document every file on its own and return all of them, each wrapped in exactly the same two marker lines, in the same order, with nothing outside the markers.
+
+{files}"""
+
+
+file_summary_template = """Summarize the following {language} file from a software repository in 2-4 sentences: what it is for, its main classes/functions, and any frameworks, external services, environment variables or commands it relies on. Reply with the summary only.
+
+File: {path}
+{code}"""
+
+
+directory_summary_template = """Below are summaries of the files and sub-directories inside the directory `{path}` of a software repository. Summarize in 3-6 sentences what this directory contains and does as a whole, keeping any technologies, environment variables, setup or run commands mentioned. Reply with the summary only.
+
+{children}"""
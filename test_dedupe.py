@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from fakes import FakeEmbeddings
+from indexing import index_repository, open_manifest, open_vector_store
+
+duplicate = "def shared(values):\n    total = 0\n    for value in values:\n        total += value * value\n    return total\n"
+
+
+def _aliases(vector_store, repo, source):
+    ids = open_manifest(vector_store, str(repo)).files[source]["ids"]
+    docs = vector_store.get_by_ids(ids)
+    assert docs
+    return [alias for doc in docs for alias in doc.metadata.get("aliases", "").split(", ") if alias]
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "dup.py").write_text(duplicate)
+    (repo / "m0.py").write_text(duplicate)
+    return repo
+
+
+@pytest.mark.parametrize("edit", ["remove", "change"])
+def test_alias_dropped_when_its_file_goes(repo, edit):
+    vector_store = open_vector_store(str(repo), FakeEmbeddings(16), backend="numpy")
+    stats = index_repository(vector_store, str(repo))
+    assert stats["duplicates"] == 1
+    kept, alias = sorted(str(repo / name) for name in ("dup.py", "m0.py"))
+    assert [a.split(":")[0] for a in _aliases(vector_store, repo, kept)] == [alias]
+
+    if edit == "remove":
+        (repo / "m0.py").unlink()
+    else:
+        (repo / "m0.py").write_text("def other():\n    return 1\n")
+    stats = index_repository(vector_store, str(repo))
+    assert stats["removed" if edit == "remove" else "changed"] == 1
+    assert _aliases(vector_store, repo, kept) == []
@@ -0,0 +1,95 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from gitignore import GitIgnoreMatcher
+
+# Conformance corpus: each case is ({directory: .gitignore contents}, [paths to check]).
+# Directory paths end with a slash.
+corpus = [
+    (
+        {"": "node_modules/\n*.log\n/build\ndocs/*.md\n!docs/keep.md\n"},
+        [
+            "node_modules/", "a/node_modules/", "a/node_modules/x.js",
+            "app.log", "src/app.log", "build/", "build/out.py", "src/build/",
+            "docs/a.md", "docs/keep.md", "docs/sub/a.md", "src/main.py",
+        ],
+    ),
+    (
+        {"": "*.js\n", "src/": "!keep.js\n/local.py\n", "lib/": "gen/\n"},
+        [
+            "a.js", "src/a.js", "src/keep.js", "src/deep/keep.js", "lib/keep.js",
+            "local.py", "src/local.py", "src/deep/local.py", "lib/gen/", "lib/gen/x.py",
+            "gen/x.py", "src/gen/x.py",
+        ],
+    ),
+    (
+        {"": "**/logs\n**/cache/*.tmp\nabc/**\n!abc/keep.py\na/**/b\n", "x/": "*\n!*.py\n"},
+        [
+            "logs/", "logs/x.py", "a/logs/", "deep/a/logs/y.py", "cache/a.tmp", "z/cache/a.tmp",
+            "z/cache/d/a.tmp", "abc/keep.py", "abc/d.py", "abc/e/f.py", "a/b", "a/x/b", "a/x/y/b",
+            "x/a.txt", "x/a.py", "x/sub/", "x/sub/a.py",
+        ],
+    ),
+    (
+        {"": "[abc].py\n[!x]y.py\nfile?.go\n\\#hash.py\n\\!bang.py\ntrailing.py   \n# comment\n"},
+        [
+            "a.py", "d.py", "ay.py", "xy.py", "file1.go", "file12.go", "#hash.py",
+            "!bang.py", "trailing.py", "comment",
+        ],
+    ),
+    (
+        {"": "build/\n!build/keep.py\n", "pkg/": "!*.log\n", "pkg/sub/": "*.log\n"},
+        [
+            "build/keep.py", "build/", "pkg/a.log", "pkg/sub/a.log", "pkg/other/a.log",
+        ],
+    ),
+    (
+        # Deep chain of nested .gitignore files, each overriding its parent
+        {
+            "": "*.log\n", "a/": "!*.log\n", "a/b/": "*.log\n!keep.log\n", "a/b/c/": "!*.log\ntmp/\n",
+            "a/b/c/d/": "*.log\n/only.py\n", "a/b/c/d/e/": "!only.py\n",
+        },
+        [
+            "x.log", "a/x.log", "a/b/x.log", "a/b/keep.log", "a/b/c/x.log", "a/b/c/keep.log", "a/b/c/tmp/",
+            "a/b/c/d/tmp/x.py", "a/b/c/d/x.log", "a/b/c/d/keep.log", "a/b/c/d/only.py", "a/b/c/d/e/only.py",
+            "a/b/c/d/e/x.log", "a/b/c/d/e/f/g/x.log", "a/b/c/d/e/f/g/only.py",
+        ],
+    ),
+]
+
+
+def _check_ignore(root, paths):
+    """
+    The paths `git check-ignore` reports as ignored: the reference behaviour.
+    """
+    proc = subprocess.run(
+        ["git", "-C", root, "check-ignore", "--no-index", "--stdin"],
+        input="\n".join(paths) + "\n", capture_output=True, text=True,
+    )
+    return set(proc.stdout.splitlines())
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+@pytest.mark.parametrize("gitignores, paths", corpus)
+def test_matches_git_check_ignore(tmp_path, gitignores, paths):
+    root = str(tmp_path)
+    subprocess.run(["git", "init", "-q", root], check=True)
+    for rel_dir, contents in gitignores.items():
+        os.makedirs(os.path.join(root, rel_dir), exist_ok=True)
+        with open(os.path.join(root, rel_dir, ".gitignore"), "w") as f:
+            f.write(contents)
+    for path in paths:
+        full_path = os.path.join(root, path)
+        if path.endswith("/"):
+            os.makedirs(full_path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            open(full_path, "a").close()
+
+    expected = _check_ignore(root, paths)
+    matcher = GitIgnoreMatcher(root)
+    actual = {path for path in paths if matcher.is_ignored(path, is_dir=path.endswith("/"))}
+    assert actual == expected
@@ -0,0 +1,50 @@
+import asyncio
+import concurrent.futures
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain_openai")
+
+import pipeline
+from fakes import FakeEmbeddings
+from indexing import open_vector_store
+from llm_engine import LLMScheduler
+from metrics import metrics
+
+
+def _totals(metrics):
+    totals = {}
+    for (name, _), value in metrics.counters.items():
+        totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def test_index_in_pool_keeps_worker_metrics(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    for i in range(5):
+        (repo / f"m{i}.py").write_text(f"def f{i}():\n    return {i}\n")
+    monkeypatch.chdir(tmp_path)
+    metrics.reset()
+    vector_store = open_vector_store(str(repo), FakeEmbeddings(16), backend="numpy")
+
+    async def run():
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as pool:
+            return await pipeline.index_in_pool(vector_store, str(repo), pool, LLMScheduler(name="embedding"),
+                                                with_graph=True)
+
+    try:
+        stats = asyncio.run(run())
+    finally:
+        pipeline.prepared_files.pop(str(repo), None)
+        pipeline.prepared_graphs.pop(str(repo), None)
+
+    totals = _totals(metrics)
+    stages = {dict(labels)["stage"] for name, labels in metrics.histograms if name == "stage_seconds"}
+    assert stats["added"] == 5
+    assert totals["files_scanned_total"] == 5
+    # Read once for the index and once for the dependency graph
+    assert totals["files_read_total"] == 10
+    assert totals["chunks_total"] == 5
+    assert {"scan", "embed"} <= stages
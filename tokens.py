@@ -0,0 +1,32 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _encoding_for(model):
+    # Imported on first use: commands that never count tokens skip loading it
+    try:
+        import tiktoken
+    except ImportError:  # tiktoken ships with langchain_openai, but keep a fallback
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """
+    Number of tokens `text` takes for `model`, exact when tiktoken is installed
+    and estimated at ~4 characters per token otherwise.
+    """
+    encoding = _encoding_for(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def model_name_of(model, default="gpt-3.5-turbo"):
+    """
+    Best-effort model name of a LangChain chat model or LLM.
+    """
+    return getattr(model, "model_name", None) or getattr(model, "model", None) or default
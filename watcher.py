@@ -0,0 +1,427 @@
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import struct
+import time
+
+from files import aiter_contents, is_source_file, scan_extensions, scan_subfolders, skip_filenames
+from gitignore import GitIgnoreMatcher
+from indexing import index_repository, open_manifest, open_vector_store
+from inline_docs import result_path, run_all
+from llm_engine import LLMScheduler, RateLimiter
+from metrics import configure_logging, metrics
+import pipeline
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+# A file is done being written (in place, or renamed into place) or is gone
+watch_mask = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+              | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+_event_header = struct.Struct("iIII")
+
+
+def _is_candidate(name):
+    """
+    Cheap name check applied to every event, before the full `is_source_file`.
+    """
+    return name == ".gitignore" or (name not in skip_filenames and os.path.splitext(name)[1] in scan_extensions)
+
+
+def _walk_dirs(matcher):
+    """
+    Yields (directory, entries) for every directory `files.walk_source_files`
+    enters: .git, symlinked and ignored directories are skipped.
+    """
+    pending = [(matcher.root, "", ())]
+    while pending:
+        dir_path, rel_dir, parent_stack = pending.pop()
+        stack = matcher.stack_for(rel_dir, parent_stack)
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        yield dir_path, entries
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir() and not entry.is_symlink()
+            except OSError:
+                continue
+            if is_dir and entry.name != ".git" and not matcher.match(rel_dir + entry.name, True, stack):
+                pending.append((entry.path, rel_dir + entry.name + "/", stack))
+
+
+class ChangeQueue:
+    """
+    Coalesces file events into batches. A batch is released once no event has
+    arrived for `debounce` seconds, or `max_delay` seconds after its first
+    event, so a burst (a checkout, a build, a formatter run) becomes one batch.
+    Past `max_pending` paths the batch collapses into a rescan, which bounds
+    memory whatever the burst.
+    """
+
+    def __init__(self, debounce=0.5, max_delay=10.0, max_pending=10_000):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.paths = set()
+        self.rescan = False
+        self._first = self._last = None
+        self._event = asyncio.Event()
+
+    def _touch(self):
+        now = time.monotonic()
+        if self._first is None:
+            self._first = now
+        self._last = now
+        self._event.set()
+
+    def add(self, path):
+        if not self.rescan:
+            self.paths.add(path)
+            if len(self.paths) > self.max_pending:
+                self.request_rescan()
+                return
+        self._touch()
+
+    def request_rescan(self):
+        self.paths = set()
+        self.rescan = True
+        self._touch()
+
+    async def get(self):
+        """
+        Waits for the next batch and returns (paths, rescan).
+        """
+        await self._event.wait()
+        while True:
+            deadline = min(self._last + self.debounce, self._first + self.max_delay)
+            delay = deadline - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        batch = (self.paths, self.rescan)
+        self.paths, self.rescan = set(), False
+        self._first = self._last = None
+        self._event.clear()
+        return batch
+
+
+class InotifySource:
+    """
+    File events from inotify(7), called through libc with ctypes: one watch on
+    every directory the scan enters. The event loop reads the descriptor only
+    when events are pending, so an idle watcher uses no CPU. Raises OSError when
+    inotify is unavailable or the watch limit (fs.inotify.max_user_watches) is
+    reached; the caller then falls back to polling.
+    """
+
+    def __init__(self, matcher, queue):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.queue = queue
+        self.dirs = {}
+        try:
+            self.resync(matcher)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def resync(self, matcher):
+        """
+        Watches every directory the scan enters under the (new) `matcher`.
+        Watching an already watched directory is a no-op.
+        """
+        self.matcher = matcher
+        for dir_path, _ in _walk_dirs(matcher):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dir_path), watch_mask)
+            if wd >= 0:
+                self.dirs[wd] = dir_path
+                continue
+            err = ctypes.get_errno()
+            # The directory went away or cannot be read: nothing to watch
+            if err not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                raise OSError(err, f"inotify_add_watch({dir_path}): {os.strerror(err)}")
+
+    def start(self, loop):
+        loop.add_reader(self.fd, self._read)
+
+    def close(self, loop):
+        loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+    def _read(self):
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _event_header.unpack_from(data, offset)
+            name = data[offset + _event_header.size:offset + _event_header.size + length].split(b"\0", 1)[0]
+            offset += _event_header.size + length
+            self._handle(wd, mask, os.fsdecode(name))
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped by the kernel
+            self.queue.request_rescan()
+            return
+        if mask & IN_IGNORED:
+            self.dirs.pop(wd, None)
+            return
+        dir_path = self.dirs.get(wd)
+        if dir_path is None or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # Reported to the parent directory as well
+            return
+        path = os.path.join(dir_path, name)
+        if mask & IN_ISDIR:
+            # A directory appeared, moved or disappeared: its whole subtree changed
+            rel_path = os.path.relpath(path, self.matcher.root).replace(os.sep, "/")
+            if name != ".git" and not self.matcher.is_ignored(rel_path, True):
+                self.queue.request_rescan()
+            return
+        if mask & IN_CREATE:
+            # Followed by IN_CLOSE_WRITE once the file is written
+            return
+        if name == ".gitignore":
+            self.queue.request_rescan()
+        elif _is_candidate(name):
+            self.queue.add(path)
+
+
+class PollingSource:
+    """
+    Fallback for systems without inotify: walks the tree every `interval`
+    seconds and compares the mtime and size of every candidate file.
+    """
+
+    def __init__(self, matcher, queue, interval=2.0):
+        self.matcher = matcher
+        self.queue = queue
+        self.interval = interval
+        self.snapshot = None
+        self._task = None
+
+    def resync(self, matcher):
+        self.matcher = matcher
+
+    def _snapshot(self):
+        snapshot = {}
+        for _, entries in _walk_dirs(self.matcher):
+            for entry in entries:
+                if not _is_candidate(entry.name):
+                    continue
+                try:
+                    if entry.is_file():
+                        st = entry.stat()
+                        snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    continue
+        return snapshot
+
+    async def _run(self):
+        self.snapshot = await asyncio.to_thread(self._snapshot)
+        while True:
+            await asyncio.sleep(self.interval)
+            snapshot = await asyncio.to_thread(self._snapshot)
+            changed = [path for path, signature in snapshot.items() if self.snapshot.get(path) != signature]
+            changed += [path for path in self.snapshot if path not in snapshot]
+            self.snapshot = snapshot
+            for path in changed:
+                if os.path.basename(path) == ".gitignore":
+                    self.queue.request_rescan()
+                else:
+                    self.queue.add(path)
+
+    def start(self, loop):
+        self._task = loop.create_task(self._run())
+
+    def close(self, loop):
+        if self._task is not None:
+            self._task.cancel()
+
+
+class RepositoryWatcher:
+    """
+    Keeps the vector store, inline docs and generated artifacts of one
+    repository up to date as its files change.
+
+    Each batch of changes goes through `index_repository` with the tracked file
+    list, so only files whose content changed are read and re-embedded. Those
+    files are then documented again, and results of removed files are deleted.
+    The `artifacts` (e.g. "readme", "diagram") are regenerated once
+    `regenerate_after` files have changed since they were last generated.
+
+    Events come from inotify, or from polling every `poll_interval` seconds
+    when it is given or inotify is unavailable.
+    """
+
+    def __init__(self, path, idx, vector_store, model, scheduler, artifacts=("readme", "diagram"), docs=True,
+                 regenerate_after=20, debounce=0.5, max_delay=10.0, poll_interval=None):
+        self.path = path
+        self.root = os.path.realpath(path)
+        self.idx = idx
+        self.vector_store = vector_store
+        self.manifest = open_manifest(vector_store, path)
+        self.model = model
+        self.scheduler = scheduler
+        self.artifacts = list(artifacts or ())
+        self.docs = docs
+        self.regenerate_after = regenerate_after
+        self.poll_interval = poll_interval
+        self.queue = ChangeQueue(debounce, max_delay)
+        self.matcher = GitIgnoreMatcher(self.root)
+        self.source = None
+        self.files = None
+        self.pending_changes = 0
+
+    def _open_source(self):
+        if self.poll_interval is None:
+            try:
+                return InotifySource(self.matcher, self.queue)
+            except OSError as e:
+                logger.warning("[⚠️] inotify unavailable for %s (%s), polling every 2s instead", self.path, e)
+        return PollingSource(self.matcher, self.queue, self.poll_interval or 2.0)
+
+    async def run(self):
+        """
+        Syncs the index with the tree, then applies batches of changes until
+        cancelled. A failed batch is logged and the watcher carries on.
+        """
+        loop = asyncio.get_running_loop()
+        # Watching starts before the first sync, so no edit can fall in between
+        self.source = self._open_source()
+        self.source.start(loop)
+        try:
+            await self.apply(set(), rescan=True, initial=True)
+            logger.info("[👀] Watching %s (%d files, %s)", self.path, len(self.files),
+                        type(self.source).__name__.replace("Source", "").lower())
+            while True:
+                paths, rescan = await self.queue.get()
+                try:
+                    await self.apply(paths, rescan)
+                except Exception as e:
+                    metrics.count("watch_errors_total", repo=self.path)
+                    logger.error("[❌] Update of %s failed: %r", self.path, e)
+        finally:
+            self.source.close(loop)
+
+    async def apply(self, paths, rescan=False, initial=False):
+        """
+        Brings the index up to date with changes to `paths` (or to the whole
+        tree with `rescan`), then the docs and artifacts, unless `initial`.
+        """
+        start = time.perf_counter()
+        if rescan:
+            # .gitignore files may have changed, so the rules are reloaded
+            self.matcher = GitIgnoreMatcher(self.root)
+            self.source.resync(self.matcher)
+            self.files = set(await asyncio.to_thread(scan_subfolders, self.root))
+        else:
+            for file in paths:
+                if is_source_file(file, self.matcher):
+                    self.files.add(file)
+                else:
+                    self.files.discard(file)
+
+        before = {file: entry["hash"] for file, entry in self.manifest.files.items()}
+        with metrics.span("watch_index", repo=self.path):
+            await asyncio.to_thread(index_repository, self.vector_store, self.root, self.manifest,
+                                    files=sorted(self.files))
+        updated = [file for file, entry in self.manifest.files.items() if before.get(file) != entry["hash"]]
+        removed = [file for file in before if file not in self.manifest.files]
+        if initial or not (updated or removed):
+            return
+
+        if self.docs:
+            if updated:
+                await run_all(aiter_contents(updated), self.model, scheduler=self.scheduler, repo=self.path)
+            for file in removed:
+                try:
+                    os.remove(result_path(file))
+                except OSError:
+                    pass
+
+        self.pending_changes += len(updated) + len(removed)
+        if self.artifacts and self.pending_changes >= self.regenerate_after:
+            await self.regenerate()
+
+        elapsed = time.perf_counter() - start
+        metrics.count("watch_files_updated_total", len(updated) + len(removed), repo=self.path)
+        metrics.observe("watch_update_seconds", elapsed, repo=self.path)
+        logger.info("[🔄] %s: %d updated, %d removed in %.2fs", self.path, len(updated), len(removed), elapsed)
+
+    async def regenerate(self):
+        pipeline.prepared_files[self.path] = sorted(self.files)
+        try:
+            results = await asyncio.gather(
+                *(pipeline.run_artifact(name, self.path, self.vector_store, self.model, self.idx, self.scheduler)
+                  for name in self.artifacts),
+                return_exceptions=True,
+            )
+        finally:
+            pipeline.prepared_files.pop(self.path, None)
+        self.pending_changes = 0
+        for name, result in zip(self.artifacts, results):
+            if isinstance(result, Exception):
+                logger.error("[❌] %s failed for %s: %r", name, self.path, result)
+            else:
+                logger.info("[📄] Regenerated %s for %s", name, self.path)
+
+
+async def watch_repositories(repo_paths, embeddings, model, artifacts=("readme", "diagram"), docs=True,
+                             regenerate_after=20, debounce=0.5, max_delay=10.0, poll_interval=None, backend=None,
+                             llm_concurrency=8, requests_per_minute=3500, tokens_per_minute=90_000):
+    """
+    Watches every repository until cancelled (e.g. by Ctrl-C). All of them
+    share one LLM scheduler, so the API limits hold for the whole set.
+    """
+    scheduler = LLMScheduler(llm_concurrency, RateLimiter(requests_per_minute, tokens_per_minute))
+    watchers = [
+        RepositoryWatcher(path, idx, open_vector_store(path, embeddings, backend), model, scheduler, artifacts, docs,
+                          regenerate_after, debounce, max_delay, poll_interval)
+        for idx, path in enumerate(repo_paths)
+    ]
+    results = await asyncio.gather(*(watcher.run() for watcher in watchers), return_exceptions=True)
+    for path, result in zip(repo_paths, results):
+        if isinstance(result, Exception):
+            logger.error("[❌] Stopped watching %s: %r", path, result)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from const import paths
+    from llm_cache import enable_llm_cache
+    from models import get_embeddings, get_model
+
+    configure_logging()
+    enable_llm_cache()
+    try:
+        asyncio.run(watch_repositories(sys.argv[1:] or paths, get_embeddings(), get_model()))
+    except KeyboardInterrupt:
+        logger.info("[👋] Stopped watching")
+    metrics.export()